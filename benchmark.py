@@ -0,0 +1,217 @@
+import asyncio
+import time
+from coyote_protocol import B0Encoder, encode_waveform
+from metrics import LatencyHistogram, MetricsRegistry, StageTimer, instrument
+from recording import Recording, ReplayCaptureSession
+
+
+
+def _legacy_b0_frame(seq, a_mode, a_value, b_mode, b_value,
+                     a_frequencies, a_intensities, b_frequencies, b_intensities):
+    """旧版send_b0_command的组帧方式（逐字节append），作为对照"""
+    if len(a_frequencies) != 4 or len(a_intensities) != 4:
+        raise ValueError("A通道需要4组频率和强度数据")
+    if len(b_frequencies) != 4 or len(b_intensities) != 4:
+        raise ValueError("B通道需要4组频率和强度数据")
+    command = bytearray()
+    command.append(0xB0)
+    command.append((seq << 4) | (a_mode << 2) | b_mode)
+    command.append(max(0, min(a_value, 200)))
+    command.append(max(0, min(b_value, 200)))
+    for i in range(4):
+        command.append(a_frequencies[i])
+    for i in range(4):
+        command.append(a_intensities[i])
+    for i in range(4):
+        command.append(b_frequencies[i])
+    for i in range(4):
+        command.append(b_intensities[i])
+    return bytes(command)
+
+
+def _per_call(func, rounds):
+    start = time.perf_counter()
+    for i in range(rounds):
+        func(i)
+    return (time.perf_counter() - start) / rounds
+
+
+def bench_b0_encode(rounds: int = 200000) -> dict:
+    """B0组帧耗时对比（微秒/帧）"""
+    freqs, ints = [10, 20, 30, 40], [20, 40, 60, 80]
+
+    encoder = B0Encoder()
+    wave = encode_waveform(freqs, ints)
+    encoder.set_waveform(wave, wave)
+
+    legacy = _per_call(lambda i: _legacy_b0_frame(i & 15, 3, i & 127, 3, i & 127, freqs, ints, freqs, ints), rounds)
+    encoded = _per_call(lambda i: bytes(encoder.encode(i & 15, 3, i & 127, 3, i & 127)), rounds)
+    return {'legacy_us': legacy * 1e6, 'encoder_us': encoded * 1e6}
+
+
+def bench_metrics_overhead(rounds: int = 200000) -> dict:
+    """各种计时钩子相对空调用的额外开销（微秒/次）"""
+    registry = MetricsRegistry(('stage',))
+    histogram = LatencyHistogram()
+
+    class Target:
+        def call(self):
+            pass
+
+    target = Target()
+    baseline = _per_call(lambda i: target.call(), rounds)
+
+    def stage_timer(i):
+        with StageTimer(histogram):
+            target.call()
+
+    def registry_timer(i):
+        with registry.timer('stage', 'battle'):
+            target.call()
+
+    stage = _per_call(stage_timer, rounds)
+    scoped = _per_call(registry_timer, rounds)
+    instrument(target, 'call', registry, 'stage')
+    wrapped = _per_call(lambda i: target.call(), rounds)
+    return {
+        'stage_timer_us': (stage - baseline) * 1e6,
+        'registry_timer_us': (scoped - baseline) * 1e6,
+        'instrument_us': (wrapped - baseline) * 1e6,
+    }
+
+
+class StubController:
+    def __init__(self, write_delay: float = 0.0):
+        """
+        替代郊狼蓝牙控制器的桩对象，只记录强度写入
+
+        :param write_delay: 模拟每次蓝牙写入的耗时（秒）
+        """
+        self.write_delay = write_delay
+        self.strengths = []
+        self.on_strength_written = None
+
+    async def connect(self):
+        pass
+
+    async def set_waveform(self, *args, **kwargs):
+        pass
+
+    async def set_absolute_strength(self, value: int, stamp=None):
+        if self.write_delay:
+            await asyncio.sleep(self.write_delay)
+        self.strengths.append(value)
+        if stamp is not None and self.on_strength_written is not None:
+            self.on_strength_written(stamp)
+
+    def start_streaming(self):
+        pass
+
+    async def disconnect(self):
+        pass
+
+    def get_stream_stats(self) -> dict:
+        return {'strength_updates': len(self.strengths)}
+
+    def get_ack_stats(self) -> dict:
+        return {}
+
+    def get_link_stats(self) -> dict:
+        return {}
+
+
+def evaluate_ocr(detector, capture: ReplayCaptureSession) -> dict:
+    """
+    在带标注的帧上逐帧走一遍检测器的截图 + OCR路径，统计各区域识别准确率
+    :return: {区域名: {'total', 'correct', 'accuracy'}}
+    """
+    report = {}
+    plan = detector.plan
+    for i, areas in sorted(capture.recording.labels.items()):
+        for name, expected in areas.items():
+            if name not in plan.area_scenes:
+                continue
+            capture.seek(i)
+            regions = detector.capture_regions(plan.scenes[plan.area_scenes[name]])
+            text = "".join(text for text, _ in detector._read_ocr(name, regions[name])).replace(" ", "")
+            entry = report.setdefault(name, {'total': 0, 'correct': 0})
+            entry['total'] += 1
+            entry['correct'] += text == str(expected).replace(" ", "")
+    for entry in report.values():
+        entry['accuracy'] = entry['correct'] / entry['total']
+    return report
+
+
+def run_replay(path: str, capture_mode: str = 'roi', realtime: bool = False,
+               write_delay: float = 0.0, **detector_kwargs) -> dict:
+    """
+    把录像送入真实的检测流水线（控制器为桩对象），统计吞吐、各阶段延迟和OCR准确率
+
+    :param path: 录像目录
+    :param capture_mode: full / roi
+    :param realtime: True时按录制时间轴回放，False时不做等待、尽可能快地处理
+    :param write_delay: 桩控制器模拟的蓝牙写入耗时（秒）
+    :param detector_kwargs: 传给AdvancedWindowDetector的其他参数，例如ocr_factory、ocr_workers
+    """
+    from main import AdvancedWindowDetector
+
+    recording = Recording(path)
+    capture = ReplayCaptureSession(recording, realtime=realtime)
+    if not realtime:
+        detector_kwargs.setdefault('scene_intervals', {'battle': 0, 'rouge': 0, None: 0})
+        detector_kwargs.setdefault('min_interval', 0)
+    detector = AdvancedWindowDetector(
+        "replay", capture=capture, capture_mode=capture_mode,
+        controller=StubController(write_delay), **detector_kwargs
+    )
+
+    async def replay():
+        await detector.startup()
+        start = time.perf_counter()
+        task = asyncio.create_task(detector._detection_loop())
+        while not capture.finished:
+            await asyncio.sleep(0.005)
+        elapsed = time.perf_counter() - start
+        detector.stop()
+        await task
+        return elapsed
+
+    try:
+        elapsed = asyncio.run(replay())
+        frames = capture.grabs
+        stats = detector.get_performance_stats()
+        return {
+            'frames': frames,
+            'processed': detector.frame_count,
+            'elapsed': elapsed,
+            'capture_fps': frames / elapsed,
+            'processed_fps': detector.frame_count / elapsed,
+            'stages': stats['stages'],
+            'scenes': stats['scenes'],
+            'ocr_triggers': stats['ocr_triggers'],
+            'estimator': stats['estimator'],
+            'ocr_accuracy': evaluate_ocr(detector, capture),
+        }
+    finally:
+        # 回放不经过Supervisor，检测器自行创建的OCR进程池/识别器要在这里关闭
+        detector.close()
+
+
+# 使用示例：python benchmark.py [录像目录]
+if __name__ == "__main__":
+    import sys
+
+    result = bench_b0_encode()
+    print(f"B0组帧：逐字节 {result['legacy_us']:.3f}us/帧，预编码 {result['encoder_us']:.3f}us/帧")
+    result = bench_metrics_overhead()
+    print("计时钩子额外开销：", {name: f"{us:.3f}us" for name, us in result.items()})
+
+    if len(sys.argv) > 1:
+        for mode in ('full', 'roi'):
+            result = run_replay(sys.argv[1], capture_mode=mode)
+            print(f"[{mode}] {result['frames']}帧，{result['capture_fps']:.1f}帧/秒，"
+                  f"处理{result['processed']}帧（{result['processed_fps']:.1f}帧/秒）")
+            for name, summary in result['stages'].items():
+                print(f"  {name:<10} p50 {summary['p50_ms']:.3f}ms  p95 {summary['p95_ms']:.3f}ms  p99 {summary['p99_ms']:.3f}ms")
+            for name, entry in result['ocr_accuracy'].items():
+                print(f"  OCR {name}: {entry['correct']}/{entry['total']}（{entry['accuracy']:.1%}）")
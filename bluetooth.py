@@ -1,12 +1,32 @@
 import asyncio
 from bleak import BleakClient, BleakScanner
 from bleak.exc import BleakError
+import json
+import os
 import time
+from metrics import LatencyHistogram
+from coyote_protocol import B0Encoder, convert_frequency, encode_waveform
+from waveform import Waveform, WaveformGenerator, WaveformLibrary
 
 class CoyoteBluetoothController:
     BASE_UUID = "0000xxxx-0000-1000-8000-00805f9b34fb"
+    SLOT_PERIOD = 0.1 # 郊狼3.0协议要求每100ms发送一条B0指令
     
-    def __init__(self, device_name="47L121000"):
+    def __init__(self, device_name="47L121000", client_factory=BleakClient, ack_timeout=1.0,
+                 waveform_file=None, scanner=BleakScanner, address_cache=None,
+                 direct_timeout=3.0, reconnect_delays=(0.5, 10.0)):
+        """
+        郊狼3.0蓝牙控制器
+
+        :param device_name: 设备蓝牙名称
+        :param client_factory: 创建BLE客户端的可调用对象 (设备或地址, disconnected_callback=...)，测试时可替换为假客户端
+        :param ack_timeout: 等待B1回复的默认超时（秒）
+        :param waveform_file: 可选的JSON波形库文件
+        :param scanner: 提供find_device_by_name的扫描器，测试时可替换
+        :param address_cache: 可选的JSON文件，保存 {设备名: 地址}，下次启动时先按地址直连
+        :param direct_timeout: 按缓存地址直连的超时（秒），失败后改为扫描
+        :param reconnect_delays: 断线重连的 (首次等待, 最长等待) 秒数，每次失败等待时间翻倍
+        """
         self._service_uuid = self._uuid(0x180C)
         self._write_uuid = self._uuid(0x150A)
         self._notify_uuid = self._uuid(0x150B)
@@ -14,25 +34,159 @@ class CoyoteBluetoothController:
         
         self.device_name = device_name
         self.client = None
-        self._seq = 0 #不用回复
-        self._response_event = asyncio.Event()
-        self._pending_commands = {}
+        self._client_factory = client_factory
+        self._scanner = scanner
+        self.address_cache = address_cache
+        self.address = self._load_address()
+        self.direct_timeout = direct_timeout
+        self.reconnect_delays = reconnect_delays
+        self._closing = False
+        self._loop = None
+        self._reconnect_task = None
+        self._disconnected_at = None
+        self.link_stats = {'connects': 0, 'direct_connects': 0, 'scans': 0, 'disconnects': 0,
+                           'reconnects': 0, 'failed_attempts': 0}
+        self.connect_latency = LatencyHistogram()
+        self.reconnect_latency = LatencyHistogram()
+        self._seq = 0 # 上一次分配的序列号，0表示不需要回复
+        self._pending_commands = {} # 序列号 -> (Future, 发送时间, 超时句柄)
         self._connected = False
+        self.ack_timeout = ack_timeout
+        self._current_strength = {'A': 0, 'B': 0} # 设备B1回报的实际强度
+        self.ack_stats = {'acked': 0, 'timeouts': 0, 'unmatched': 0, 'seq_exhausted': 0}
+        self.ack_rtt = LatencyHistogram()
         self.B0_state = {'a_strength':5,'b_strength':5,
-                         'a_frequencies':[10,10,10,10],'a_intensities':[5,5,5,5],
-                         'b_frequencies':[10,10,10,10],'b_intensities':[5,5,5,5]}
+                         'a_waveform':'default','b_waveform':'default'}
+
+        # A/B通道各自的波形发生器，每个时隙按需取出下一段波形
+        self.waveforms = WaveformLibrary(waveform_file)
+        self.channel_a = WaveformGenerator(self.waveforms.get('default'))
+        self.channel_b = WaveformGenerator(self.waveforms.get('default'))
+
+        # B0流式发送：后台任务每个100ms时隙只发一帧，强度目标通过“最新值优先”的信箱合并
+        self._stream_task = None
+        self._encoder = B0Encoder()
+        self._strength_dirty = False
+        self._strength_stamp = None # 尚未发出的强度目标对应的调用方标记
+        self.on_strength_written = None # 强度真正写入蓝牙后以该标记回调，用于统计端到端延迟
+        self.stream_stats = {'frames': 0, 'strength_updates': 0, 'coalesced': 0, 'missed_slots': 0, 'offline_slots': 0}
+        self.write_latency = LatencyHistogram()
 
     def _uuid(self, short_uuid):
         return self.BASE_UUID.replace("xxxx", f"{short_uuid:04X}")
 
+    def _load_address(self):
+        if not self.address_cache or not os.path.exists(self.address_cache):
+            return None
+        try:
+            with open(self.address_cache, encoding="utf-8") as f:
+                return json.load(f).get(self.device_name)
+        except (OSError, ValueError):
+            return None
+
+    def _save_address(self):
+        if not self.address_cache:
+            return
+        addresses = {}
+        if os.path.exists(self.address_cache):
+            try:
+                with open(self.address_cache, encoding="utf-8") as f:
+                    addresses = json.load(f)
+            except (OSError, ValueError):
+                pass
+        addresses[self.device_name] = self.address
+        with open(self.address_cache, 'w', encoding="utf-8") as f:
+            json.dump(addresses, f, ensure_ascii=False, indent=1)
+
+    async def _open(self, target, timeout):
+        """连接设备并订阅通知"""
+        client = self._client_factory(target, disconnected_callback=self._on_disconnect)
+        try:
+            await asyncio.wait_for(client.connect(), timeout)
+            await client.start_notify(self._notify_uuid, self._notification_handler)
+        except BaseException:
+            try:
+                await client.disconnect()
+            except Exception:
+                pass
+            raise
+        self.client = client
+        self._connected = True
+
     async def connect(self, timeout=10.0):
-        device = await BleakScanner.find_device_by_name(self.device_name, timeout=timeout)
+        """有缓存地址时先直连，失败或没有地址时再按名称扫描（扫描最长可达timeout秒）"""
+        self._loop = asyncio.get_running_loop()
+        self._closing = False
+        start = time.perf_counter()
+        if self.address:
+            try:
+                await self._open(self.address, self.direct_timeout)
+                self.link_stats['direct_connects'] += 1
+                self.link_stats['connects'] += 1
+                self.connect_latency.record(time.perf_counter() - start)
+                return
+            except (BleakError, asyncio.TimeoutError, OSError) as e:
+                print(f"按地址直连失败，改为扫描: {str(e)}")
+
+        self.link_stats['scans'] += 1
+        device = await self._scanner.find_device_by_name(self.device_name, timeout=timeout)
         if not device:
             raise BleakError(f"Device {self.device_name} not found")
-        
-        self.client = BleakClient(device)
-        await self.client.connect()
-        self._connected = True
+
+        await self._open(device, timeout)
+        self.link_stats['connects'] += 1
+        self.connect_latency.record(time.perf_counter() - start)
+        if device.address != self.address:
+            self.address = device.address
+            self._save_address()
+
+    def _on_disconnect(self, client):
+        """Bleak断线回调（可能不在事件循环线程中），主动断开时不重连"""
+        if client is not self.client or self._closing or self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._handle_disconnect)
+
+    def _handle_disconnect(self):
+        if not self._connected or self._closing:
+            return
+        self._connected = False
+        self._disconnected_at = time.perf_counter()
+        self.link_stats['disconnects'] += 1
+        # 在途指令不会再有回复
+        for seq in list(self._pending_commands):
+            self._pending_commands[seq][2].cancel()
+            self._expire(seq)
+        print("郊狼连接断开，开始重连")
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.ensure_future(self._reconnect_loop())
+
+    async def _reconnect_loop(self):
+        """按退避间隔重连，成功后重新发出最后一次设定的强度（波形由发生器继续播放）"""
+        delay, max_delay = self.reconnect_delays
+        while not self._closing:
+            await asyncio.sleep(delay)
+            try:
+                await self.connect()
+            except Exception as e:
+                self.link_stats['failed_attempts'] += 1
+                delay = min(delay * 2, max_delay)
+                print(f"重连失败，{delay:.2f}秒后重试: {str(e)}")
+                continue
+            self.link_stats['reconnects'] += 1
+            self.reconnect_latency.record(time.perf_counter() - self._disconnected_at)
+            await self._restore_state()
+            print("郊狼已重新连接")
+            return
+
+    async def _restore_state(self):
+        """重放断线前的目标强度"""
+        if self.streaming:
+            self._strength_dirty = True
+            return
+        try:
+            await self._send_frame(0b11, self.B0_state['a_strength'], 0b11, self.B0_state['b_strength'])
+        except Exception as e:
+            print(f"恢复强度失败: {str(e)}")
 
     def _notification_handler(self, sender, data):
         try:
@@ -40,37 +194,87 @@ class CoyoteBluetoothController:
                 return
                 
             if data[0] == 0xB1:
-                seq = (data[1] & 0xF0) >> 4  # 更安全的位运算
-                if 0 <= seq <= 15:  # 序列号有效性检查
-                    self._current_strength['A'] = data[2]
-                    self._current_strength['B'] = data[3]
-                    
-                    if seq in self._pending_commands:
-                        del self._pending_commands[seq]
-                        self._response_event.set()
-                else:
-                    print(f"无效序列号: {seq}")        
+                # 序列号按独立字节解析，兼容放在高4位的写法
+                seq = data[1] if data[1] <= 0x0F else (data[1] & 0xF0) >> 4
+                # 设备回报的实际强度（含设备端限幅、拨轮调整）只记在这里，
+                # B0_state保存目标强度，设定值的合并以目标为准
+                self._current_strength['A'] = data[2]
+                self._current_strength['B'] = data[3]
+
+                if seq == 0:
+                    return # 设备端（如拨轮）引起的强度变化，没有对应的指令
+                pending = self._pending_commands.pop(seq, None)
+                if pending is None:
+                    self.ack_stats['unmatched'] += 1
+                    return
+                future, sent_at, timeout_handle = pending
+                timeout_handle.cancel()
+                self.ack_rtt.record(time.perf_counter() - sent_at)
+                self.ack_stats['acked'] += 1
+                if not future.done():
+                    future.set_result((data[2], data[3]))
         except Exception as e:
             print(f"通知处理错误: {str(e)}")
             # 可添加异常日志记录
 
-    async def _send_command(self, command, wait_response=False):
+    def _allocate_seq(self) -> int:
+        """在1~15中分配一个没有在途指令的序列号，全部占用时返回0（不要求回复）"""
+        for _ in range(15):
+            self._seq = self._seq % 15 + 1
+            if self._seq not in self._pending_commands:
+                return self._seq
+        self.ack_stats['seq_exhausted'] += 1
+        return 0
+
+    def _expire(self, seq):
+        """序列号超时：释放序列号，等待方得到None"""
+        pending = self._pending_commands.pop(seq, None)
+        if pending is None:
+            return
+        self.ack_stats['timeouts'] += 1
+        future = pending[0]
+        if not future.done():
+            future.set_result(None)
+
+    def _track(self, seq, timeout):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        timeout_handle = loop.call_later(timeout, self._expire, seq)
+        self._pending_commands[seq] = (future, time.perf_counter(), timeout_handle)
+        return future
+
+    async def _send_command(self, command, wait_response=False, seq=0, timeout=None):
+        """
+        写入指令，seq非0时登记为在途指令，由B1回复完成
+        :return: wait_response为True时返回设备回报的 (A强度, B强度)
+        """
         if not self._connected:
             raise BleakError("Not connected to device")
-        
-        await self.client.write_gatt_char(self._write_uuid, command)
-        if wait_response:
-            self._response_event.wait()
-            self._response_event.clear()
+
+        future = self._track(seq, timeout or self.ack_timeout) if seq else None
+        try:
+            await self.client.write_gatt_char(self._write_uuid, command)
+        except Exception:
+            # 断线处理可能已在写入期间让该序列号过期（甚至已被重新分配），只撤销自己的登记
+            pending = self._pending_commands.get(seq) if seq else None
+            if pending is not None and pending[0] is future:
+                del self._pending_commands[seq]
+                pending[2].cancel()
+            raise
+        if wait_response and future is not None:
+            result = await future
+            if result is None:
+                raise asyncio.TimeoutError(f"序列号{seq}的B1回复超时")
+            return result
 
     def _convert_frequency(self, input_freq):
-        if 10 <= input_freq <= 100:
-            return input_freq
-        elif 101 <= input_freq <= 600:
-            return (input_freq - 100) // 5 + 100
-        elif 601 <= input_freq <= 1000:
-            return (input_freq - 600) // 10 + 200
-        return 10
+        return convert_frequency(input_freq)
+
+    def _frame_seq(self, a_strength_mode, b_strength_mode) -> int:
+        """只有强度变化的指令才分配序列号、需要B1回复"""
+        if (a_strength_mode != 0b00 or b_strength_mode != 0b00) and self._connected:
+            return self._allocate_seq()
+        return 0
 
     # 该函数是周期执行还是每次更改后调用？
     async def send_b0_command(self, 
@@ -78,102 +282,195 @@ class CoyoteBluetoothController:
                             b_strength_mode, b_strength_value,
                             a_frequencies, a_intensities,
                             b_frequencies, b_intensities,
-                            wait_response=False): 
-        # 验证输入参数
-        if len(a_frequencies) != 4 or len(a_intensities) != 4:
-            raise ValueError("A通道需要4组频率和强度数据")
-        if len(b_frequencies) != 4 or len(b_intensities) != 4:
-            raise ValueError("B通道需要4组频率和强度数据")
-
-        # 构造指令头
-        command = bytearray()
-        command.append(0xB0)
-        
-        # 序列号和强度模式
-        seq = self._seq % 16
-        strength_mode = (a_strength_mode << 2) | b_strength_mode
-        command.append((seq << 4) | strength_mode)
-        
-        # 通道强度值
-        command.append(max(0, min(a_strength_value, 200)))
-        command.append(max(0, min(b_strength_value, 200)))
-
-        # 处理波形数据
-        for i in range(4):
-            command.append(a_frequencies[i])
-        for i in range(4):
-            command.append(a_intensities[i])
-        for i in range(4):
-            command.append(b_frequencies[i])
-        for i in range(4):
-            command.append(b_intensities[i])
-        
+                            wait_response=False, timeout=None): 
+        # 编码波形（输入频率查表转换）
+        encoder = B0Encoder()
+        encoder.set_waveform(
+            encode_waveform(a_frequencies, a_intensities),
+            encode_waveform(b_frequencies, b_intensities))
+
+        # 序列号、强度模式和通道强度值
+        seq = self._frame_seq(a_strength_mode, b_strength_mode)
+        command = encoder.encode(seq, a_strength_mode, a_strength_value, b_strength_mode, b_strength_value)
+
         # 发送指令
-        await self._send_command(bytes(command), wait_response)
+        return await self._send_command(bytes(command), wait_response, seq, timeout)
 
-    async def set_absolute_strength(self,value):
-        mode = 0b11
-        a_val = value
-        b_val = value
-        
-        await self.send_b0_command(
-            a_strength_mode=mode,
-            a_strength_value=a_val,
-            b_strength_mode=mode,
-            b_strength_value=b_val,
-            a_frequencies=self.B0_state['a_frequencies'],
-            a_intensities=self.B0_state['a_intensities'],
-            b_frequencies=self.B0_state['b_frequencies'],
-            b_intensities=self.B0_state['b_intensities'],
-            wait_response=False)
+    @property
+    def streaming(self) -> bool:
+        return self._stream_task is not None and not self._stream_task.done()
+
+    def start_streaming(self):
+        """启动后台B0发送任务，之后强度/波形修改只更新状态，由调度器按时隙发出"""
+        if not self.streaming:
+            self._stream_task = asyncio.create_task(self._stream_loop())
+
+    async def stop_streaming(self):
+        if self._stream_task is not None:
+            self._stream_task.cancel()
+            try:
+                await self._stream_task
+            except asyncio.CancelledError:
+                pass
+            self._stream_task = None
+
+    async def _send_frame(self, a_mode, a_value, b_mode, b_value, wait_response=False):
+        """用两个通道发生器的下一段波形组帧并发送，帧缓冲区复用，只改写波形和帧头"""
+        self._encoder.set_waveform(self.channel_a.next_slot(), self.channel_b.next_slot())
+        seq = self._frame_seq(a_mode, b_mode)
+        command = self._encoder.encode(seq, a_mode, a_value, b_mode, b_value)
+        return await self._send_command(bytes(command), wait_response, seq)
+
+    async def _send_slot(self):
+        """发送一个时隙的B0帧：强度有更新时用绝对设定模式，否则强度不变只续发波形"""
+        if not self._connected:
+            # 断线期间不发送，强度目标保留到重连后
+            self.stream_stats['offline_slots'] += 1
+            return
+        mode = 0b00
+        a_val = b_val = 0
+        stamp = None
+        if self._strength_dirty:
+            self._strength_dirty = False
+            stamp, self._strength_stamp = self._strength_stamp, None
+            mode = 0b11
+            a_val = self.B0_state['a_strength']
+            b_val = self.B0_state['b_strength']
+            self.stream_stats['strength_updates'] += 1
+
+        start = time.perf_counter()
+        try:
+            await self._send_frame(mode, a_val, mode, b_val)
+        except Exception:
+            if mode == 0b11:
+                self._strength_dirty = True # 下一个时隙重发
+                if self._strength_stamp is None:
+                    self._strength_stamp = stamp
+            raise
+        self.write_latency.record(time.perf_counter() - start)
+        self.stream_stats['frames'] += 1
+        self._strength_written(stamp)
+
+    def _strength_written(self, stamp):
+        if stamp is not None and self.on_strength_written is not None:
+            self.on_strength_written(stamp)
+
+    async def _stream_loop(self):
+        """固定节拍的B0调度器，落后超过一个时隙时跳过错过的时隙而不是补发"""
+        loop = asyncio.get_running_loop()
+        next_slot = loop.time()
+        while True:
+            delay = next_slot - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                await self._send_slot()
+            except Exception as e:
+                print(f"B0发送失败: {str(e)}")
+            next_slot += self.SLOT_PERIOD
+            behind = loop.time() - next_slot
+            if behind > self.SLOT_PERIOD:
+                missed = int(behind / self.SLOT_PERIOD)
+                self.stream_stats['missed_slots'] += missed
+                next_slot += missed * self.SLOT_PERIOD
+
+    def get_stream_stats(self) -> dict:
+        """调度器统计：已发帧数、强度更新数、被合并的强度修改数、错过的时隙数和写入延迟"""
+        return dict(self.stream_stats, write_latency=self.write_latency.summary())
+
+    async def set_absolute_strength(self,value, stamp=None):
+        """
+        设定A/B通道强度
+        :param stamp: 可选标记，强度真正写入蓝牙后传给on_strength_written；
+                      多次修改合并成一次写入时保留最早的标记
+        """
+        if self.streaming:
+            value = max(0, min(value, 200))
+            if self._strength_dirty or (value == self.B0_state['a_strength'] and value == self.B0_state['b_strength']):
+                # 与当前目标相同，或覆盖了尚未发出的目标
+                self.stream_stats['coalesced'] += 1
+            if value != self.B0_state['a_strength'] or value != self.B0_state['b_strength']:
+                self.B0_state['a_strength'] = value
+                self.B0_state['b_strength'] = value
+                self._strength_dirty = True
+                if self._strength_stamp is None:
+                    self._strength_stamp = stamp
+            return
+
+        if not self._connected and self._reconnect_task is not None:
+            # 正在重连：只记录目标强度，重连成功后发出
+            self.B0_state['a_strength'] = self.B0_state['b_strength'] = max(0, min(value, 200))
+            return
+        await self._send_frame(0b11, value, 0b11, value)
         self.B0_state['a_strength'] = value
         self.B0_state['b_strength'] = value
+        self._strength_written(stamp)
 
     async def adjust_strength(self, delta):
+        if self.streaming:
+            await self.set_absolute_strength(self.B0_state['a_strength'] + delta)
+            return
+
         mode = 0b01 if delta > 0 else 0b10
         value = abs(delta)
-        
-        await self.send_b0_command(
-            a_strength_mode=mode,
-            a_strength_value=value,
-            b_strength_mode=mode,
-            b_strength_value=value,
-            a_frequencies=self.B0_state['a_frequencies'],
-            a_intensities=self.B0_state['a_intensities'],
-            b_frequencies=self.B0_state['b_frequencies'],
-            b_intensities=self.B0_state['b_intensities'],
-            wait_response=False)
+        await self._send_frame(mode, value, mode, value)
         self.B0_state['a_strength'] += delta
         self.B0_state['b_strength'] += delta
 
-    async def set_waveform(self,frequencies, intensities):
-        a_freq = frequencies
-        a_int = intensities
-        b_freq = frequencies
-        b_int = intensities
-
-        await self.send_b0_command(
-            a_strength_mode=0b00,
-            a_strength_value=0,
-            b_strength_mode=0b00,
-            b_strength_value=0,
-            a_frequencies=a_freq,
-            a_intensities=a_int,
-            b_frequencies=b_freq,
-            b_intensities=b_int,
-            wait_response=False)
-        self.B0_state['a_frequencies'] = frequencies
-        self.B0_state['b_frequencies'] = frequencies
-        self.B0_state['a_intensities'] = intensities
-        self.B0_state['b_intensities'] = intensities
+    async def _switch_waveform(self, waveform: Waveform, channel: str):
+        """切换通道波形（替换发生器引用），未开启流式发送时立即发一帧"""
+        if 'A' in channel:
+            self.channel_a.set(waveform)
+            self.B0_state['a_waveform'] = waveform.name
+        if 'B' in channel:
+            self.channel_b.set(waveform)
+            self.B0_state['b_waveform'] = waveform.name
+        if not self.streaming:
+            await self._send_frame(0b00, 0, 0b00, 0)
+
+    async def set_waveform(self,frequencies, intensities, channel='AB'):
+        """
+        设置自定义波形
+        :param frequencies: 频率序列（每25ms一步，长度任意）
+        :param intensities: 波形强度序列，与频率等长
+        :param channel: 作用的通道 A/B/AB
+        """
+        await self._switch_waveform(Waveform(frequencies, intensities, "custom"), channel)
+
+    async def set_pattern(self, name, channel='AB'):
+        """切换到波形库中的具名波形"""
+        await self._switch_waveform(self.waveforms.get(name), channel)
 
     def get_current_strength(self):
         return self.B0_state['a_strength']
+
+    def get_device_strength(self) -> dict:
+        """设备通过B1回报的实际强度"""
+        return dict(self._current_strength)
+
+    def get_link_stats(self) -> dict:
+        """连接统计：连接/直连/扫描/断线/重连次数，以及连接耗时和从断线到重连成功的耗时"""
+        return dict(
+            self.link_stats,
+            connected=self._connected,
+            address=self.address,
+            connect_latency=self.connect_latency.summary(),
+            reconnect_latency=self.reconnect_latency.summary(),
+        )
+
+    def get_ack_stats(self) -> dict:
+        """应答统计：已确认/超时/无匹配数、在途指令数和往返时间分布"""
+        return dict(self.ack_stats, in_flight=len(self._pending_commands), rtt=self.ack_rtt.summary())
     
     def print_current_state(self):
         print(self.B0_state)
 
     async def disconnect(self):
+        self._closing = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        await self.stop_streaming()
         if self.client and self._connected:
             await self.client.disconnect()
             self._connected = False
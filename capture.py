@@ -0,0 +1,326 @@
+import time
+import numpy as np
+
+try:
+    import ctypes
+    import win32gui
+    import win32ui
+    import win32con
+    from ctypes import wintypes
+
+    # 必须声明参数类型，否则64位下缓冲区地址会按32位int传入而被截断
+    _get_bitmap_bits = ctypes.windll.gdi32.GetBitmapBits
+    _get_bitmap_bits.argtypes = (wintypes.HBITMAP, wintypes.LONG, ctypes.c_void_p)
+    _get_bitmap_bits.restype = wintypes.LONG
+except ImportError:  # 非Windows环境（例如在Linux上测性能）只能使用合成画面源
+    win32gui = win32ui = win32con = _get_bitmap_bits = None
+
+
+class CaptureBackend:
+    """
+    画面来源接口
+
+    grab() 返回 HxWx4 的 BGRX 数组视图，底层缓冲区在帧之间复用，
+    下一次 grab() 会覆盖其内容，需要保留的数据请自行 copy()
+    """
+
+    def grab(self) -> np.ndarray:
+        raise NotImplementedError
+
+    def query_size(self) -> tuple:
+        """刷新并返回当前画面尺寸 (width, height)，ROI模式据此换算区域"""
+        return self.size
+
+    def grab_regions(self, rects: dict) -> dict:
+        """
+        只抓取指定的子区域
+
+        :param rects: {名称: (x, y, w, h)} 像素矩形，会被缓存引用，内容变化时请传入新的字典
+        :return: {名称: hxwx4 BGRX 数组}，各区域使用独立的预分配缓冲区
+        默认实现先整帧抓取再切片拷贝，子类可覆盖为真正的局部抓取
+        """
+        frame = self.grab()
+        return copy_regions(frame, rects, self._region_buffers(rects))
+
+    def _region_buffers(self, rects: dict) -> dict:
+        """按矩形尺寸复用各区域的输出缓冲区"""
+        buffers = getattr(self, '_roi_buffers', None)
+        cached = getattr(self, '_roi_rects', None)
+        if buffers is None or (rects is not cached and rects != cached):
+            buffers = {name: np.empty((h, w, 4), dtype=np.uint8) for name, (x, y, w, h) in rects.items()}
+            self._roi_buffers = buffers
+            self._roi_rects = rects
+        return buffers
+
+    def close(self):
+        pass
+
+    @property
+    def size(self) -> tuple:
+        """当前画面尺寸 (width, height)"""
+        raise NotImplementedError
+
+    @property
+    def scale_factor(self) -> float:
+        """当前DPI缩放比例"""
+        return 1.0
+
+
+def copy_regions(frame: np.ndarray, rects: dict, buffers: dict) -> dict:
+    """把整帧中的各矩形拷入对应缓冲区"""
+    for name, (x, y, w, h) in rects.items():
+        buffers[name][:, :, :frame.shape[2]] = frame[y:y + h, x:x + w]
+    return buffers
+
+
+class GdiCaptureSession(CaptureBackend):
+    ROI_SETS = 8 # 最多同时保留的ROI位图套数（每个场景计划一套，规则重新加载会产生新的计划）
+
+    def __init__(self, hwnd):
+        """
+        基于GDI BitBlt的持久化截图会话
+
+        DC与位图在帧之间保持存活，仅当客户区尺寸或DPI缩放变化时重建
+        DPI缩放只在窗口移到另一台显示器时重新查询
+        :param hwnd: 目标窗口句柄
+        """
+        if win32gui is None:
+            raise RuntimeError("GDI截图仅支持Windows")
+        self.hwnd = hwnd
+        self._hwnd_dc = None
+        self._mfc_dc = None
+        self._save_dc = None
+        self._bitmap = None
+        self._buffer = None
+        self._size = (0, 0)
+        self._scale_factor = None
+        self._monitor = None
+        self._roi_dc = None
+        self._roi_original = None # ROI DC创建时自带的位图，删除ROI位图前先选回它
+        self._roi_sets = []       # [(矩形字典, 位图, 缓冲区)]，按最近使用排序
+        self._roi_bitmaps = {}
+        self._roi_rects = None
+        self._roi_buffers = None
+        self.rebuild_count = 0
+
+    @staticmethod
+    def _get_scale_factor(monitor=None):
+        # 根据窗口所在显示器的DPI缩放比例调整捕获尺寸
+        try:
+            if monitor:
+                factor = ctypes.c_int()
+                if ctypes.windll.shcore.GetScaleFactorForMonitor(monitor, ctypes.byref(factor)) == 0:
+                    return factor.value / 100
+            return ctypes.windll.shcore.GetScaleFactorForDevice(0) / 100
+        except Exception:
+            return 1
+
+    def _delete_bitmaps(self, bitmaps: dict):
+        # 仍被选入DC的位图无法删除，先换回DC原有的位图
+        if self._roi_original is not None:
+            self._roi_dc.SelectObject(self._roi_original)
+        for bitmap in bitmaps.values():
+            win32gui.DeleteObject(bitmap.GetHandle())
+
+    def _release_regions(self):
+        """释放所有ROI位图和ROI DC"""
+        for _, bitmaps, _ in self._roi_sets:
+            self._delete_bitmaps(bitmaps)
+        self._roi_sets = []
+        self._roi_bitmaps = {}
+        self._roi_rects = None
+        self._roi_buffers = None
+        if self._roi_dc is not None:
+            self._roi_dc.DeleteDC()
+            self._roi_dc = None
+            self._roi_original = None
+
+    def _release(self):
+        """释放GDI资源"""
+        self._release_regions()
+        # 整帧位图仍被选入_save_dc，先删除DC再删除位图，否则DeleteObject失败、位图泄漏
+        if self._save_dc is not None:
+            self._save_dc.DeleteDC()
+            self._save_dc = None
+        if self._bitmap is not None:
+            win32gui.DeleteObject(self._bitmap.GetHandle())
+            self._bitmap = None
+        if self._mfc_dc is not None:
+            self._mfc_dc.DeleteDC()
+            self._mfc_dc = None
+        if self._hwnd_dc is not None:
+            win32gui.ReleaseDC(self.hwnd, self._hwnd_dc)
+            self._hwnd_dc = None
+
+    def _rebuild(self, w, h, scale_factor):
+        """按新的尺寸/缩放重建DC，整帧位图与ROI位图在首次使用时再创建"""
+        self._release()
+        self._hwnd_dc = win32gui.GetWindowDC(self.hwnd)
+        self._mfc_dc = win32ui.CreateDCFromHandle(self._hwnd_dc)
+        self._size = (w, h)
+        self._scale_factor = scale_factor
+        self.rebuild_count += 1
+
+    def _ensure_full(self):
+        """创建整帧位图和复用缓冲区"""
+        if self._bitmap is not None:
+            return
+        w, h = self._size
+        self._save_dc = self._mfc_dc.CreateCompatibleDC()
+        self._bitmap = win32ui.CreateBitmap()
+        self._bitmap.CreateCompatibleBitmap(self._mfc_dc, w, h)
+        self._save_dc.SelectObject(self._bitmap)
+        self._buffer = np.empty((h, w, 4), dtype=np.uint8)
+
+    def _ensure_regions(self, rects: dict):
+        """
+        为每个ROI创建独立位图和预分配缓冲区
+
+        每个矩形字典（即每个场景计划）保留一套位图，场景切换时直接复用，
+        最多保留ROI_SETS套，超出时释放最久未用的一套
+        """
+        if rects is self._roi_rects:
+            return
+        for i, entry in enumerate(self._roi_sets):
+            if entry[0] is rects or entry[0] == rects:
+                break
+        else:
+            if self._roi_dc is None:
+                self._roi_dc = self._mfc_dc.CreateCompatibleDC()
+            bitmaps, buffers = {}, {}
+            for name, (x, y, w, h) in rects.items():
+                bitmap = win32ui.CreateBitmap()
+                bitmap.CreateCompatibleBitmap(self._mfc_dc, w, h)
+                bitmaps[name] = bitmap
+                buffers[name] = np.empty((h, w, 4), dtype=np.uint8)
+            entry = (rects, bitmaps, buffers)
+            self._roi_sets.insert(0, entry)
+            i = 0
+            while len(self._roi_sets) > self.ROI_SETS:
+                self._delete_bitmaps(self._roi_sets.pop()[1])
+        self._roi_sets.insert(0, self._roi_sets.pop(i))
+        self._roi_rects, self._roi_bitmaps, self._roi_buffers = entry
+
+    def _ensure(self):
+        left, top, right, bottom = win32gui.GetClientRect(self.hwnd)
+        w = right - left
+        h = bottom - top
+        if w <= 0 or h <= 0:
+            raise RuntimeError("窗口客户区为空（可能已最小化）")
+        monitor = ctypes.windll.user32.MonitorFromWindow(self.hwnd, 2)  # MONITOR_DEFAULTTONEAREST
+        if monitor != self._monitor or self._scale_factor is None:
+            self._monitor = monitor
+            scale_factor = self._get_scale_factor(monitor)
+        else:
+            scale_factor = self._scale_factor
+        if (w, h) != self._size or scale_factor != self._scale_factor:
+            self._rebuild(w, h, scale_factor)
+        return left, top
+
+    def grab(self) -> np.ndarray:
+        left, top = self._ensure()
+        self._ensure_full()
+        w, h = self._size
+        self._save_dc.BitBlt(
+            (0, 0),
+            (int(w * self._scale_factor), int(h * self._scale_factor)),
+            self._mfc_dc, (left, top), win32con.SRCCOPY
+        )
+        # 直接把位图数据拷进复用缓冲区（32位兼容位图即为BGRX排列）
+        _get_bitmap_bits(self._bitmap.GetHandle(), self._buffer.nbytes, self._buffer.ctypes.data)
+        return self._buffer
+
+    def query_size(self) -> tuple:
+        self._ensure()
+        return self._size
+
+    def grab_regions(self, rects: dict) -> dict:
+        left, top = self._ensure()
+        self._ensure_regions(rects)
+        for name, (x, y, w, h) in rects.items():
+            bitmap = self._roi_bitmaps[name]
+            buffer = self._roi_buffers[name]
+            previous = self._roi_dc.SelectObject(bitmap)
+            if self._roi_original is None:
+                self._roi_original = previous
+            self._roi_dc.BitBlt((0, 0), (w, h), self._mfc_dc, (left + x, top + y), win32con.SRCCOPY)
+            _get_bitmap_bits(bitmap.GetHandle(), buffer.nbytes, buffer.ctypes.data)
+        return self._roi_buffers
+
+    @property
+    def size(self) -> tuple:
+        return self._size
+
+    @property
+    def scale_factor(self) -> float:
+        return self._scale_factor or 1.0
+
+    def close(self):
+        self._release()
+        self._buffer = None
+        self._size = (0, 0)
+        self._scale_factor = None
+        self._monitor = None
+
+
+class SyntheticCaptureSession(CaptureBackend):
+    def __init__(self, width: int = 1920, height: int = 1080, frames=None):
+        """
+        内存画面源，用于脱离Windows测量每帧开销
+
+        :param width: 画面宽度
+        :param height: 画面高度
+        :param frames: 可选的帧列表（HxWx3 BGR 或 HxWx4 BGRX），循环播放；为空时生成随机画面
+        """
+        if frames:
+            height, width = frames[0].shape[:2]
+        else:
+            rng = np.random.default_rng(0)
+            frames = [rng.integers(0, 256, (height, width, 4), dtype=np.uint8)]
+        self._frames = frames
+        self._index = 0
+        self._size = (width, height)
+        self._buffer = np.zeros((height, width, 4), dtype=np.uint8)
+
+    def grab(self) -> np.ndarray:
+        frame = self._frames[self._index]
+        self._index = (self._index + 1) % len(self._frames)
+        # 模拟BitBlt：把整帧拷入复用缓冲区
+        self._buffer[:, :, :frame.shape[2]] = frame
+        return self._buffer
+
+    def grab_regions(self, rects: dict) -> dict:
+        # 直接从源帧拷贝子区域，模拟只BitBlt ROI的开销
+        frame = self._frames[self._index]
+        self._index = (self._index + 1) % len(self._frames)
+        return copy_regions(frame, rects, self._region_buffers(rects))
+
+    @property
+    def size(self) -> tuple:
+        return self._size
+
+
+def measure_capture(backend: CaptureBackend, frames: int = 200, rects: dict = None) -> float:
+    """测量每帧平均抓取耗时（秒），给定rects时测量ROI模式"""
+    grab = backend.grab if rects is None else (lambda: backend.grab_regions(rects))
+    grab()  # 预热
+    start = time.perf_counter()
+    for _ in range(frames):
+        grab()
+    return (time.perf_counter() - start) / frames
+
+
+# 使用示例
+if __name__ == "__main__":
+    for w, h in ((1920, 1080), (2560, 1440), (3840, 2160)):
+        session = SyntheticCaptureSession(w, h)
+        # 两个OCR区域加四个3x3探针，与检测器实际使用的区域规模相当
+        rects = {
+            'life': (int(w * 0.1251), int(h * 0.0491), int(w * 0.1083), int(h * 0.0685)),
+            'leak': (int(w * 0.6445), int(h * 0.0556), int(w * 0.0520), int(h * 0.0234)),
+        }
+        for i, (px, py) in enumerate(((5.37, 9.86), (1.94, 5.88), (66.83, 6.92), (55.88, 93.58))):
+            rects[f'probe{i}'] = (int(w * px / 100) - 1, int(h * py / 100) - 1, 3, 3)
+        full = measure_capture(session)
+        roi = measure_capture(session, rects=rects)
+        print(f"{w}x{h} 整帧：{full * 1000:.3f}ms  ROI：{roi * 1000:.3f}ms")
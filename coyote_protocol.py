@@ -0,0 +1,69 @@
+B0_FRAME_SIZE = 20
+
+# 帧布局：0 指令头 | 1 序列号<<4|强度模式 | 2 A强度 | 3 B强度 | 4-7 A频率 | 8-11 A波形强度 | 12-15 B频率 | 16-19 B波形强度
+A_WAVE = slice(4, 12)
+B_WAVE = slice(12, 20)
+
+
+def _build_frequency_lut() -> bytes:
+    """输入频率(10~1000) -> 协议频率值(10~240)，范围外映射为10"""
+    lut = bytearray(1001)
+    for freq in range(1001):
+        if 10 <= freq <= 100:
+            lut[freq] = freq
+        elif 101 <= freq <= 600:
+            lut[freq] = (freq - 100) // 5 + 100
+        elif 601 <= freq <= 1000:
+            lut[freq] = (freq - 600) // 10 + 200
+        else:
+            lut[freq] = 10
+    return bytes(lut)
+
+
+FREQUENCY_LUT = _build_frequency_lut()
+
+
+def convert_frequency(freq: int) -> int:
+    """查表转换输入频率"""
+    return FREQUENCY_LUT[freq] if 0 <= freq <= 1000 else 10
+
+
+def encode_waveform(frequencies, intensities) -> bytes:
+    """
+    把一个通道100ms内的4组频率/强度预编码为8字节
+    :param frequencies: 4个输入频率（10~1000）
+    :param intensities: 4个波形强度（0~100）
+    """
+    if len(frequencies) != 4 or len(intensities) != 4:
+        raise ValueError("每个通道需要4组频率和强度数据")
+    return bytes(convert_frequency(f) for f in frequencies) + bytes(max(0, min(i, 100)) for i in intensities)
+
+
+class B0Encoder:
+    def __init__(self):
+        """
+        B0帧编码器
+
+        帧缓冲区只分配一次，波形部分在设置波形时写入，
+        每次发送只改写序列号/强度模式和两个强度字节
+        """
+        self._frame = bytearray(B0_FRAME_SIZE)
+        self._frame[0] = 0xB0
+
+    def set_waveform(self, a_wave: bytes, b_wave: bytes):
+        """写入预编码的A/B通道波形（各8字节）"""
+        self._frame[A_WAVE] = a_wave
+        self._frame[B_WAVE] = b_wave
+
+    def encode(self, seq: int, a_mode: int, a_value: int, b_mode: int, b_value: int) -> bytearray:
+        """
+        填写帧头并返回复用的帧缓冲区（下次encode会被覆盖）
+        :param seq: 序列号（0~15）
+        :param a_mode: A通道强度解读方式（0b00不变 0b01增加 0b10减少 0b11绝对设定）
+        :param a_value: A通道强度值，限制在0~200
+        """
+        frame = self._frame
+        frame[1] = (seq << 4) | (a_mode << 2) | b_mode
+        frame[2] = 0 if a_value < 0 else 200 if a_value > 200 else a_value
+        frame[3] = 0 if b_value < 0 else 200 if b_value > 200 else b_value
+        return frame
@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+class _Ring:
+    def __init__(self, capacity: int):
+        """固定容量的环形缓冲区，每个槽位按图像名保存预分配数组，尺寸不变时原地覆盖"""
+        self.slots = [None] * capacity
+        self.position = 0
+        self.count = 0
+
+    def write(self, images: dict, timestamp: float):
+        slot = self.slots[self.position]
+        if slot is None:
+            slot = self.slots[self.position] = {'time': 0.0, 'images': {}}
+        buffers = slot['images']
+        for name, image in images.items():
+            buffer = buffers.get(name)
+            if buffer is None or buffer.shape != image.shape or buffer.dtype != image.dtype:
+                buffer = buffers[name] = np.empty_like(image)
+            np.copyto(buffer, image)
+        for name in buffers.keys() - images.keys():
+            del buffers[name]
+        slot['time'] = timestamp
+        self.position = (self.position + 1) % len(self.slots)
+        self.count = min(self.count + 1, len(self.slots))
+
+    def snapshot(self) -> list:
+        """按时间顺序拷贝出当前内容 [(时间, {名称: 图像}), ...]"""
+        start = (self.position - self.count) % len(self.slots)
+        entries = []
+        for i in range(self.count):
+            slot = self.slots[(start + i) % len(self.slots)]
+            entries.append((slot['time'], {name: image.copy() for name, image in slot['images'].items()}))
+        return entries
+
+
+class DebugRecorder:
+    def __init__(self, capacity: int = 30, directory: str = "debug"):
+        """
+        内存中的调试帧记录器，替代在热路径中写 temp.png / test.png
+
+        记录时只拷贝到预分配缓冲区，PNG编码和写盘只在dump时于后台线程进行
+        :param capacity: 每类记录（截图 / OCR区域）保留的最近帧数
+        :param directory: dump输出目录，每次dump建立一个子目录
+        """
+        self.capacity = capacity
+        self.directory = directory
+        self._rings = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="debug-dump")
+        self.dumps = 0
+
+    def record(self, kind: str, images: dict):
+        """
+        记录一帧
+        :param kind: 记录类别，例如 frame / ocr
+        :param images: {名称: 图像}
+        """
+        timestamp = time.time()
+        with self._lock:
+            ring = self._rings.get(kind)
+            if ring is None:
+                ring = self._rings[kind] = _Ring(self.capacity)
+            ring.write(images, timestamp)
+
+    def dump(self, reason: str = "manual"):
+        """
+        把当前缓冲区内容写到磁盘（在后台线程中编码）
+        :return: Future，结果为输出目录
+        """
+        with self._lock:
+            snapshot = {kind: ring.snapshot() for kind, ring in self._rings.items()}
+            self.dumps += 1
+            name = time.strftime("%Y%m%d-%H%M%S") + f"-{self.dumps}-{reason}"
+        return self._executor.submit(self._write, snapshot, os.path.join(self.directory, name))
+
+    def _write(self, snapshot: dict, path: str) -> str:
+        os.makedirs(path, exist_ok=True)
+        for kind, entries in snapshot.items():
+            for i, (timestamp, images) in enumerate(entries):
+                stamp = time.strftime("%H%M%S", time.localtime(timestamp)) + f"{timestamp % 1:.3f}"[1:]
+                for name, image in images.items():
+                    if image.ndim == 3 and image.shape[2] == 4:
+                        image = image[:, :, :3]
+                    cv2.imwrite(os.path.join(path, f"{kind}_{i:03d}_{stamp}_{name}.png"), image)
+        return path
+
+    def close(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,224 @@
+import os
+import threading
+import cv2
+import numpy as np
+
+GLYPH_SIZE = (12, 16)  # 字形模板尺寸 (宽, 高)
+DEFAULT_CHARSET = "0123456789/"
+
+
+def _normalize(glyphs: np.ndarray) -> np.ndarray:
+    """把字形展平并做零均值、单位范数归一化，点积即为归一化相关系数"""
+    flat = glyphs.reshape(len(glyphs), -1).astype(np.float32)
+    flat -= flat.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(flat, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return flat / norms
+
+
+def render_templates(charset: str = DEFAULT_CHARSET) -> tuple:
+    """用OpenCV内置字体渲染一组初始模板，真实字体模板可通过learn/load补充"""
+    glyphs, labels = [], []
+    for thickness in (1, 2, 3):
+        for char in charset:
+            canvas = np.zeros((48, 48), dtype=np.uint8)
+            cv2.putText(canvas, char, (6, 38), cv2.FONT_HERSHEY_SIMPLEX, 1.2, 255, thickness)
+            for glyph in segment(canvas > 0):
+                glyphs.append(glyph)
+                labels.append(char)
+                break
+    return np.stack(glyphs), labels
+
+
+def binarize(image: np.ndarray) -> np.ndarray:
+    """Otsu二值化，文字（占少数的一侧）为True"""
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY if image.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+    _, binary = cv2.threshold(image, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    binary = binary.astype(bool)
+    return ~binary if binary.mean() > 0.5 else binary
+
+
+def segment(binary: np.ndarray, min_height: float = 0.3) -> list:
+    """
+    按列投影切分字形
+    :param binary: 二值图，文字为True
+    :param min_height: 字形高度低于文字行高该比例时视为噪点丢弃
+    :return: 缩放到GLYPH_SIZE的字形列表（从左到右）
+    """
+    rows = np.flatnonzero(binary.any(axis=1))
+    if rows.size == 0:
+        return []
+    line = binary[rows[0]:rows[-1] + 1]
+    columns = line.any(axis=0).astype(np.int8)
+    # 列投影的上升/下降沿即为各字形的左右边界
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], columns, [0]))))
+    glyphs = []
+    for start, end in zip(edges[::2], edges[1::2]):
+        glyph = line[:, start:end]
+        glyph_rows = np.flatnonzero(glyph.any(axis=1))
+        if glyph_rows.size < len(line) * min_height:
+            continue
+        glyph = glyph[glyph_rows[0]:glyph_rows[-1] + 1].astype(np.uint8) * 255
+        glyphs.append(cv2.resize(glyph, GLYPH_SIZE, interpolation=cv2.INTER_AREA))
+    return glyphs
+
+
+class DigitOCR:
+    def __init__(self, templates: str = None, fallback=None, min_confidence: float = 0.75,
+                 auto_learn: bool = True, max_per_label: int = 8, learn_confidence: float = 0.9,
+                 save_every: int = 16):
+        """
+        基于字形模板匹配的数字识别器，接口与FastOCR一致
+
+        :param templates: 模板文件路径（.npz），存在则加载，自学习的模板也会写回该文件
+        :param fallback: 置信度不足时使用的识别器，或返回识别器的工厂函数（首次使用时才创建）
+        :param min_confidence: 低于该匹配置信度时交给fallback识别
+        :param auto_learn: fallback识别结果与切分出的字形数一致且置信度足够时，把这些字形加入模板库
+        :param max_per_label: 每个字符最多保留的模板数
+        :param learn_confidence: fallback识别置信度不低于该值才学习，误读学进模板库后不会再交给fallback
+        :param save_every: 自学习累计该数量的图像后写一次模板文件，其余在close时写出
+        """
+        self.templates_path = templates
+        self._fallback = fallback
+        self.min_confidence = min_confidence
+        self.auto_learn = auto_learn
+        self.max_per_label = max_per_label
+        self.learn_confidence = learn_confidence
+        self.save_every = save_every
+        self.fallback_count = 0
+        self._unsaved = 0 # 学习后尚未写入模板文件的图像数
+        self._bank_lock = threading.Lock()
+        self._warm_thread = None # 后台预热fallback的线程
+
+        if templates and os.path.exists(templates):
+            self.load(templates)
+        else:
+            glyphs, labels = render_templates()
+            self._set_bank(glyphs, labels)
+
+    def _set_bank(self, glyphs: np.ndarray, labels: list):
+        self._glyphs = glyphs
+        self._labels = np.array(labels)
+        self._bank = _normalize(glyphs)
+
+    @property
+    def fallback(self):
+        """懒加载fallback识别器，后台预热尚未完成时等待预热结束"""
+        thread = self._warm_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        if callable(self._fallback) and not hasattr(self._fallback, 'recognize_lines'):
+            self._fallback = self._fallback()
+        return self._fallback
+
+    def warm_up(self, background: bool = True):
+        """
+        提前创建并预热fallback识别器，避免首次低置信度识别时才加载模型
+        :param background: 为True时在后台线程加载并立即返回，模板匹配不必等待模型，
+                           只有需要fallback的识别会等到加载完成
+        """
+        if self._fallback is None or self._warm_thread is not None:
+            return
+        if background:
+            self._warm_thread = threading.Thread(target=self._warm_fallback, name="ocr-warm-up", daemon=True)
+            self._warm_thread.start()
+        else:
+            self._warm_fallback()
+
+    def _warm_fallback(self):
+        fallback = self.fallback
+        if hasattr(fallback, 'warm_up'):
+            fallback.warm_up()
+
+    def load(self, path: str):
+        data = np.load(path)
+        self._set_bank(data['glyphs'], list(data['labels']))
+
+    def save(self, path: str = None):
+        """写入模板文件，先写临时文件再替换，多个进程同时保存时不会留下损坏的文件"""
+        path = path or self.templates_path
+        temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        with self._bank_lock:
+            np.savez_compressed(temp, glyphs=self._glyphs, labels=self._labels)
+            self._unsaved = 0
+        os.replace(temp, path)
+
+    def close(self):
+        """写出尚未保存的自学习模板"""
+        if self._unsaved and self.templates_path:
+            self.save()
+
+    def learn(self, image: np.ndarray, text: str) -> bool:
+        """用已知文字的图像补充模板，字形数与字符数不一致时放弃"""
+        glyphs = segment(binarize(image))
+        chars = text.replace(" ", "")
+        if not glyphs or len(glyphs) != len(chars):
+            return False
+        with self._bank_lock:
+            all_glyphs = list(self._glyphs)
+            all_labels = list(self._labels)
+            for glyph, char in zip(glyphs, chars):
+                same = [i for i, label in enumerate(all_labels) if label == char]
+                if len(same) >= self.max_per_label:
+                    # 替换最早加入的同字符模板
+                    del all_glyphs[same[0]]
+                    del all_labels[same[0]]
+                all_glyphs.append(glyph)
+                all_labels.append(char)
+            self._set_bank(np.stack(all_glyphs), all_labels)
+            self._unsaved += 1
+        if self.templates_path and self._unsaved >= self.save_every:
+            self.save()
+        return True
+
+    def match(self, image: np.ndarray) -> tuple:
+        """
+        模板匹配，所有字形与整个模板库一次矩阵乘完成比较
+        :return: (文字内容, 置信度)，置信度为各字形最佳相关系数中的最小值
+        """
+        glyphs = segment(binarize(image))
+        if not glyphs:
+            return "", 0.0
+        scores = _normalize(np.stack(glyphs)) @ self._bank.T
+        best = scores.argmax(axis=1)
+        confidence = float(scores[np.arange(len(best)), best].min())
+        return "".join(self._labels[best]), max(confidence, 0.0)
+
+    def recognize_lines(self, images: list) -> list:
+        """
+        批量识别单行数字
+        :return: 与输入一一对应的 (文字内容, 置信度) 列表
+        """
+        results = [self.match(image) for image in images]
+        uncertain = [i for i, (_, confidence) in enumerate(results) if confidence < self.min_confidence]
+        if uncertain and self.fallback is not None:
+            self.fallback_count += len(uncertain)
+            fallback_results = self.fallback.recognize_lines([images[i] for i in uncertain])
+            for i, result in zip(uncertain, fallback_results):
+                results[i] = result
+                if self.auto_learn and result[0] and result[1] >= self.learn_confidence:
+                    self.learn(images[i], result[0])
+        return results
+
+    def recognize(self, image: np.ndarray) -> list:
+        """
+        识别单张图像
+        :return: 识别结果列表，每个元素为 (文字内容, 置信度)
+        """
+        text, confidence = self.recognize_lines([image])[0]
+        return [(text, confidence)] if text else []
+
+
+# 使用示例
+if __name__ == "__main__":
+    import time
+
+    reader = DigitOCR()
+    test_image = np.zeros((40, 160), dtype=np.uint8)
+    cv2.putText(test_image, "12/30", (5, 32), cv2.FONT_HERSHEY_SIMPLEX, 1.0, 255, 2)
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        result = reader.match(test_image)
+    print("识别结果：", result, f"每次耗时：{(time.perf_counter() - start):.3f}ms")
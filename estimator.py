@@ -0,0 +1,155 @@
+from scheduler import FrameDiffGate
+
+
+class DebouncedValue:
+    def __init__(self, value=None, confirm: float = 1.5, min_confidence: float = 0.5):
+        """
+        去抖动的单个游戏数据：新值要连续读到、累计置信度达到confirm才生效
+
+        :param value: 初始值
+        :param confirm: 确认新值所需的累计置信度，每次读数贡献其置信度（0~1），
+                        默认为两次置信度0.75以上的一致读数，置信度低时需要更多次
+        :param min_confidence: 低于该置信度的读数直接丢弃
+        """
+        self.value = value
+        self.confirm = confirm
+        self.min_confidence = min_confidence
+        self.candidate = None
+        self.weight = 0.0
+        self.reads = 0
+        self.rejected = 0 # 被丢弃或被推翻的读数
+
+    @property
+    def pending(self) -> bool:
+        """是否有尚未确认的新值"""
+        return self.reads > 0
+
+    def update(self, value, confidence: float = 1.0) -> bool:
+        """
+        输入一次读数
+        :return: 确认的值是否改变
+        """
+        if confidence < self.min_confidence:
+            self.rejected += 1
+            return False
+        if value == self.value:
+            # 读数与当前值一致，之前的候选值视为误读
+            self.rejected += self.reads
+            self.candidate = None
+            self.weight = 0.0
+            self.reads = 0
+            return False
+        if value != self.candidate:
+            self.rejected += self.reads
+            self.candidate = value
+            self.weight = 0.0
+            self.reads = 0
+        self.weight += confidence
+        self.reads += 1
+        if self.weight + 1e-9 < self.confirm:
+            return False
+        self.value = value
+        self.candidate = None
+        self.weight = 0.0
+        self.reads = 0
+        return True
+
+
+class StateEstimator:
+    def __init__(self, values: dict, confirm: float = 1.5, min_confidence: float = 0.5):
+        """
+        游戏数据的去抖动状态，单次误读不会改变数据和输出强度
+
+        :param values: 各数据的初始值 {数据名: 值}
+        :param confirm: 见DebouncedValue
+        :param min_confidence: 见DebouncedValue
+        """
+        self.values = {name: DebouncedValue(value, confirm, min_confidence) for name, value in values.items()}
+        self.confirmed = 0
+
+    def __getitem__(self, name):
+        return self.values[name].value
+
+    def observe(self, values: dict, confidence: float = 1.0) -> dict:
+        """
+        输入一组读数（同一次OCR或同一帧探针）
+        :return: 本次确认改变的数据 {数据名: 新值}
+        """
+        changed = {}
+        for name, value in values.items():
+            if self.values[name].update(value, confidence):
+                changed[name] = value
+        self.confirmed += len(changed)
+        return changed
+
+    def pending(self, names=None) -> bool:
+        """给定数据（默认全部）中是否有待确认的新值"""
+        names = self.values if names is None else names
+        return any(self.values[name].pending for name in names)
+
+    def stats(self) -> dict:
+        return {
+            'confirmed': self.confirmed,
+            'rejected': sum(value.rejected for value in self.values.values()),
+            'pending': {name: value.candidate for name, value in self.values.items() if value.pending},
+        }
+
+
+class OCRTrigger:
+    def __init__(self, threshold: float = 3.0, max_skipped: int = 50):
+        """
+        事件驱动的OCR触发：区域只在可能变化时才识别
+
+        触发条件（按优先级统计）：
+          scene   切换到该区域所在的场景（例如战斗结束回到地图后读目标生命）
+          probe   区域的条件探针刚出现（例如漏怪图标出现）
+          pixels  区域像素与上次识别时相比有变化
+          pending 该区域对应的数据还有待确认的新值，需要继续读取
+        :param threshold: 区域像素变化阈值（降采样后平均绝对差，0~255）
+        :param max_skipped: 区域连续跳过该次数后强制识别一次，防止漏判
+        """
+        self.threshold = threshold
+        self.max_skipped = max_skipped
+        self._scene = None
+        self._selected = set() # 上一帧需要识别的区域
+        self._gates = {}       # 区域名 -> FrameDiffGate
+        self.counts = {'scene': 0, 'probe': 0, 'pixels': 0, 'pending': 0, 'skipped': 0}
+
+    def check(self, scene, area, image, pending: bool = False):
+        """
+        判断本帧是否要识别该区域，每个分类后的帧调用一次（area为None表示本帧没有可识别的区域）
+        :return: 触发原因，不需要识别时为None
+        """
+        previous_scene, previous_selected = self._scene, self._selected
+        self._scene = scene
+        self._selected = {area} if area is not None else set()
+        if area is None:
+            return None
+
+        gate = self._gates.get(area)
+        if gate is None:
+            gate = self._gates[area] = FrameDiffGate(self.threshold, max_skipped=self.max_skipped)
+        # 每次都让门控比较，识别时的画面成为下次比较的基准
+        changed = gate.changed([image])
+        if scene != previous_scene:
+            reason = 'scene'
+        elif area not in previous_selected:
+            reason = 'probe'
+        elif changed:
+            reason = 'pixels'
+        elif pending:
+            reason = 'pending'
+        else:
+            self.counts['skipped'] += 1
+            return None
+        self.counts[reason] += 1
+        return reason
+
+    def reset(self):
+        """规则重新加载后所有区域都重新识别一次"""
+        self._scene = None
+        self._selected = set()
+        self._gates.clear()
+
+    def stats(self) -> dict:
+        return dict(self.counts)
@@ -0,0 +1,68 @@
+def percent_to_pixel(value, max_value):
+    return int(round(max_value * value / 100))
+
+
+def area_bounds(region, width, height):
+    """(x起%, x止%, y起%, y止%) -> 像素边界 (x_start, x_end, y_start, y_end)"""
+    x_start = percent_to_pixel(region[0], width)
+    x_end = percent_to_pixel(region[1], width)
+    y_start = percent_to_pixel(region[2], height)
+    y_end = percent_to_pixel(region[3], height)
+    return x_start, x_end, y_start, y_end
+
+
+class Geometry:
+    def __init__(self, width: int, height: int, scale_factor: float, areas: dict, probes):
+        """
+        某个客户区尺寸/DPI缩放下预先算好的全部坐标
+
+        :param areas: OCR区域 {名称: (x起%, x止%, y起%, y止%)}
+        :param probes: ProbeTable，按该尺寸解析探针像素下标
+        """
+        self.width = width
+        self.height = height
+        self.scale_factor = scale_factor
+
+        self.area_rects = {}   # 名称 -> (x, y, w, h)
+        self.area_slices = {}  # 名称 -> (行切片, 列切片)，整帧模式直接用于取子图
+        for name, region in areas.items():
+            x_start, x_end, y_start, y_end = area_bounds(region, width, height)
+            self.area_rects[name] = (x_start, y_start, x_end - x_start, y_end - y_start)
+            self.area_slices[name] = (slice(y_start, y_end), slice(x_start, x_end))
+
+        probes.resolve(width, height)
+        self.probe_rects = probes.region_rects(width, height)
+        # ROI模式一次抓取的全部区域
+        self.roi_rects = dict(self.probe_rects, **self.area_rects)
+
+
+class GeometryCache:
+    def __init__(self, areas: dict, probes):
+        """
+        以 (宽, 高, DPI缩放) 为键的几何缓存，只有窗口尺寸变化或换到其他缩放的显示器时才重建
+
+        :param areas: OCR区域 {名称: (x起%, x止%, y起%, y止%)}
+        :param probes: ProbeTable
+        """
+        self.areas = areas
+        self.probes = probes
+        self._key = None
+        self._geometry = None
+        self.hits = 0
+        self.rebuilds = 0
+
+    def get(self, width: int, height: int, scale_factor: float = 1.0) -> Geometry:
+        key = (width, height, scale_factor)
+        if key == self._key:
+            self.hits += 1
+            return self._geometry
+        self._geometry = Geometry(width, height, scale_factor, self.areas, self.probes)
+        self._key = key
+        self.rebuilds += 1
+        return self._geometry
+
+    def invalidate(self):
+        self._key = None
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'rebuilds': self.rebuilds, 'key': self._key}
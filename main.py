@@ -1,27 +1,80 @@
-import win32gui
-import win32ui
-import win32con
-import cv2
 import numpy as np
 import time
-from PIL import Image
 from threading import Thread, Event
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from bluetooth import CoyoteBluetoothController
-from ocr import FastOCR
-import re
+from capture import CaptureBackend, GdiCaptureSession, win32gui
+from ocr import BatchingOCR, FastOCR, OCRCache
+from digit_ocr import DigitOCR
+from ocr_pool import OCRWorkerPool
+from metrics import JsonlExporter, MetricsRegistry, MetricsServer, instrument
+from pipeline import LatestQueue
+from scheduler import AdaptiveScheduler, FrameDiffGate
+from debug_recorder import DebugRecorder
+from estimator import OCRTrigger, StateEstimator
+from rules import GAME_VALUES, RuleFile
+import os
 import asyncio
 
+# 场景、探针、OCR区域和强度公式都在规则文件中，修改后运行中自动重新加载
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.json")
+RULES_CHECK_INTERVAL = 1.0 # 检查规则文件是否修改的间隔（秒）
+BLE_ADDRESS_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ble_devices.json") # 设备名 -> 蓝牙地址，启动时先直连
+WAVEFORM_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "waveforms.json")
+DIGIT_TEMPLATES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "digit_templates.npz") # 自学习的数字字形模板
+
+# 默认识别器：字形模板识别数字，置信度不足时用PaddleOCR兜底
+DEFAULT_OCR_FACTORY = partial(DigitOCR, templates=DIGIT_TEMPLATES, fallback=partial(FastOCR, lang="ch"))
+
 class AdvancedWindowDetector:
-    def __init__(self, window_title: str, check_interval: float = 1):
+    def __init__(self, window_title: str, check_interval: float = 1, capture: CaptureBackend = None,
+                 capture_mode: str = 'full', ocr_workers: int = 0, scene_intervals: dict = None,
+                 min_interval: float = 0.05, max_interval: float = 5.0, diff_threshold: float = 3.0,
+                 debug_frames: int = 0, controller=None, ocr_factory=None,
+                 metrics_log: str = None, metrics_port: int = None, ocr=None, capture_executor=None,
+                 rules: str = RULES_FILE, confirm_weight: float = 1.5, min_confidence: float = 0.5,
+                 ocr_change_threshold: float = 3.0):
         """
         增强型窗口检测器
         
         :param window_title: 目标窗口标题（支持模糊匹配）
-        :param check_interval: 检测间隔时间（秒）
+        :param check_interval: 各阶段等待队列的超时时间（秒）
+        :param capture: 画面来源，默认在找到窗口后创建GDI截图会话
+        :param capture_mode: full 整帧截图 / roi 只抓取探针和OCR区域
+        :param ocr_workers: 大于0时OCR在独立的工作进程池中运行，可同时进行多个识别请求
+        :param scene_intervals: 各场景的检测间隔 {场景名/None: 秒}，默认取规则文件中各场景的interval和idle_interval
+        :param min_interval: 检测间隔下限（秒）
+        :param max_interval: 检测间隔上限（秒）
+        :param diff_threshold: 帧差门控阈值，画面变化低于该值时跳过分类和OCR，为None时关闭门控
+        :param debug_frames: 大于0时在内存中保留最近的截图和OCR区域，OCR出错或调用dump_debug时写盘
+        :param controller: 强度控制器，默认在startup中连接郊狼蓝牙控制器（回放测试时可传入桩对象）
+        :param ocr_factory: 可pickle的无参识别器工厂，默认为字形模板识别 + PaddleOCR兜底
+        :param metrics_log: 统计快照JSONL文件路径，给定时每10秒追加一条（自动轮转）
+        :param metrics_port: 本地HTTP统计接口端口，给定时可通过 http://127.0.0.1:端口/metrics 查看
+        :param ocr: 已创建的识别器（例如多个检测器共享的BatchingOCR），给定时不再自行加载
+        :param capture_executor: 截图线程池，多个检测器共享时按提交顺序轮流截图
+        :param rules: 规则文件（场景、探针、OCR区域、强度公式），修改后自动重新编译
+        :param confirm_weight: 游戏数据变为新值所需的一致读数的累计置信度（默认约为两次可靠读数）
+        :param min_confidence: 低于该置信度的OCR读数直接丢弃
+        :param ocr_change_threshold: OCR区域像素变化阈值，区域不变且没有场景切换、没有待确认数据时不识别
         """
+        if capture_mode not in ('full', 'roi'):
+            raise ValueError(f"不支持的截图模式: {capture_mode}")
         self.window_title = window_title
         self.check_interval = check_interval
         self.hwnd = None
+        self.capture = capture
+        self.capture_mode = capture_mode
+        self.last_frame = None # full模式下最近一帧整帧截图
+        self.rules = RuleFile(rules)
+        self.plan = self.rules.plan
+        self._scene_hint = None # 上一帧的场景，本帧先按该场景的计划截图
+        self._rules_checked = time.perf_counter()
+        self._scene_intervals = scene_intervals # 外部指定的间隔优先于规则文件
+        self.scheduler = AdaptiveScheduler(scene_intervals or self.plan.intervals, min_interval, max_interval)
+        self.diff_gate = FrameDiffGate(diff_threshold) if diff_threshold is not None else None
+        self.debug = DebugRecorder(debug_frames) if debug_frames > 0 else None
         self._stop_event = Event()
         self._lock = Thread()  # 用于线程安全的伪锁
 
@@ -30,13 +83,43 @@ class AdvancedWindowDetector:
         self.max_life = 999
         self.load = 0 # 0代表正常，1代表混乱，2代表阻滞
         self.damage = 0 # 暂存关卡内伤害
+        # 以上数据只在多次一致的读数后才更新；OCR只在场景切换、条件探针出现或区域变化时触发
+        self.estimator = StateEstimator({name: getattr(self, name) for name in GAME_VALUES},
+                                        confirm_weight, min_confidence)
+        self.ocr_trigger = OCRTrigger(ocr_change_threshold)
 
         # 性能监控数据
         self.frame_count = 0
         self.average_process_time = 0
+        # 各阶段延迟直方图，分类之后的阶段同时按场景统计
+        self.metrics = MetricsRegistry(('capture', 'classify', 'preprocess', 'ocr', 'control', 'end_to_end'))
+        self.stage_stats = self.metrics.stages
+        self._exporters = []
+        if metrics_log:
+            self._exporters.append(JsonlExporter(self.get_performance_stats, metrics_log))
+        if metrics_port is not None:
+            self._exporters.append(MetricsServer(self.get_performance_stats, port=metrics_port))
 
-        self.ocr = FastOCR(lang="ch")
-        
+        # 流水线：截图和OCR各占一个线程，阶段之间用“最新值优先”队列连接
+        self._owns_capture_executor = capture_executor is None
+        self._capture_executor = capture_executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture")
+        self._ocr_concurrency = max(1, ocr_workers)
+        self._ocr_executor = ThreadPoolExecutor(max_workers=self._ocr_concurrency, thread_name_prefix="ocr")
+        self._ocr_applied = {} # 各区域最近一次写入结果的帧时间，防止乱序结果覆盖新值
+        self._ocr_queue = None
+        self._control_queue = None
+
+        # OCR在startup中与窗口查找、蓝牙连接并行加载
+        self.ocr_workers = ocr_workers
+        self.ocr_factory = ocr_factory
+        self.controller = controller
+        self.ocr = ocr
+        self._owns_ocr = ocr is None # 自行创建的识别器在close时关闭，共享的由创建方关闭
+        self.ocr_cache = None
+
+        # 启动耗时（秒）
+        self.startup_stats = {}
+        self._startup_begin = None
 
 
     # def _convert_color_space(self, image: np.ndarray, color_space: str) -> np.ndarray:
@@ -66,6 +149,8 @@ class AdvancedWindowDetector:
 
     def find_window(self):
         """查找目标窗口句柄"""
+        if win32gui is None:
+            return None
         def callback(hwnd, hwnd_list):
             if win32gui.IsWindowVisible(hwnd) and self.window_title.lower() in win32gui.GetWindowText(hwnd).lower():
                 hwnd_list.append(hwnd)
@@ -75,244 +160,479 @@ class AdvancedWindowDetector:
         win32gui.EnumWindows(callback, hwnd_list)
         return hwnd_list  [0] if hwnd_list else None
     
-    def capture_window(self) -> np.ndarray:
-        """捕获窗口画面"""
-        if not self.hwnd:
-            self.hwnd = self.find_window()
+    def _ensure_capture(self) -> CaptureBackend:
+        if self.capture is None:
             if not self.hwnd:
-                raise RuntimeError("找不到目标窗口")
+                self.hwnd = self.find_window()
+                if not self.hwnd:
+                    raise RuntimeError("找不到目标窗口")
+            self.capture = GdiCaptureSession(self.hwnd)
+        return self.capture
 
-        left, top, right, bottom = win32gui.GetClientRect(self.hwnd)
-        w = right - left
-        h = bottom - top
+    def capture_window(self) -> np.ndarray:
+        """捕获窗口画面，返回BGRX视图（缓冲区复用，下一帧会覆盖）"""
+        return self._ensure_capture().grab()
 
-        hwndDC = win32gui.GetWindowDC(self.hwnd)
-        mfcDC = win32ui.CreateDCFromHandle(hwndDC)
-        saveDC = mfcDC.CreateCompatibleDC()
+    def capture_regions(self, scene_plan=None) -> dict:
+        """
+        获取本帧某个场景需要的所有区域
+        
+        :param scene_plan: 场景计划，默认为上一帧的场景
+        :return: {名称: 图像}，包含该场景的OCR区域；roi模式下还包含各探针采样点的3x3区域
+        full模式下为整帧截图上的切片（探针直接在整帧上判断），roi模式下只抓取这些子区域
+        """
+        if scene_plan is None:
+            scene_plan = self._current_scene_plan()
+        capture = self._ensure_capture()
+        if self.capture_mode == 'roi':
+            width, height = capture.query_size()
+            geometry = scene_plan.geometry.get(width, height, capture.scale_factor)
+            return capture.grab_regions(geometry.roi_rects)
+        self.last_frame = capture.grab()
+        return self._crop_areas(scene_plan)
 
-        saveBitMap = win32ui.CreateBitmap()
-        saveBitMap.CreateCompatibleBitmap(mfcDC, w, h)
-        saveDC.SelectObject(saveBitMap)
+    def _crop_areas(self, scene_plan) -> dict:
+        """full模式：在最近一帧整帧截图上切出场景的OCR区域"""
+        screenshot = self.last_frame
+        height, width = screenshot.shape[:2]
+        geometry = scene_plan.geometry.get(width, height, self.capture.scale_factor)
+        return {name: screenshot[rows, cols] for name, (rows, cols) in geometry.area_slices.items()}
 
-        # 根据窗口的DPI缩放比例调整捕获尺寸
-        try:
-            import ctypes
-            scale_factor = ctypes.windll.shcore.GetScaleFactorForDevice(0) / 100
-        except:
-            scale_factor = 1
-
-        # 执行截图
-        saveDC.BitBlt((0, 0), (int(w * scale_factor), int(h * scale_factor)), mfcDC, (left, top), win32con.SRCCOPY)
-
-        bmpinfo = saveBitMap.GetInfo()
-        bmpstr = saveBitMap.GetBitmapBits(True)
-        img = Image.frombuffer(
-            'RGB',
-            (bmpinfo['bmWidth'], bmpinfo['bmHeight']),
-            bmpstr, 'raw', 'BGRX', 0, 1
-        )
+    def _crop_probes(self, scene_plan) -> list:
+        """full模式：在最近一帧整帧截图上切出场景各探针的采样区域"""
+        screenshot = self.last_frame
+        height, width = screenshot.shape[:2]
+        geometry = scene_plan.geometry.get(width, height, self.capture.scale_factor)
+        return [screenshot[y:y + h, x:x + w] for x, y, w, h in geometry.probe_rects.values()]
+
+    def _current_scene_plan(self):
+        return self.plan.scenes.get(self._scene_hint, self.plan.scenes[None])
 
-        # 资源清理
-        win32gui.DeleteObject(saveBitMap.GetHandle())
-        saveDC.DeleteDC()
-        mfcDC.DeleteDC()
-        win32gui.ReleaseDC(self.hwnd, hwndDC)
+    def _probe_state(self, regions, scene_plan) -> dict:
+        """一次性判断场景计划中的所有探针，返回 {标签: 是否命中}"""
+        if self.capture_mode == 'roi':
+            hits = scene_plan.table.evaluate_regions(regions)
+        else:
+            hits = scene_plan.table.evaluate(self.last_frame)
+        return scene_plan.table.state(hits)
+
+    def reload_rules(self) -> bool:
+        """重新编译规则文件，蓝牙连接和OCR模型保持不变；规则有误时保留原规则"""
+        try:
+            plan = self.rules.reload()
+        except Exception as e:
+            print(f"规则加载失败，继续使用原规则: {str(e)}")
+            return False
+        self.plan = plan
+        if self._scene_intervals is None:
+            self.scheduler.set_intervals(plan.intervals)
+        if self.ocr_cache is not None:
+            self.ocr_cache.clear() # 预处理参数可能已变化
+        if self.diff_gate is not None:
+            self.diff_gate.reset()
+        self.ocr_trigger.reset()
+        print("规则已重新加载：", plan.name)
+        return True
 
-        return cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+    def _check_rules(self):
+        """按间隔检查规则文件是否被修改"""
+        now = time.perf_counter()
+        if now - self._rules_checked < RULES_CHECK_INTERVAL:
+            return
+        self._rules_checked = now
+        if self.rules.changed():
+            self.reload_rules()
     
-    def _get_area_by_percantage(self,screenshot,region):
-        height, width = screenshot.shape[:2]
-        def percent_to_pixel(value, max_value):
-                return int(round(max_value * value / 100))
-        x_start = percent_to_pixel(region[0], width)
-        x_end = percent_to_pixel(region[1], width)
-        y_start = percent_to_pixel(region[2], height)
-        y_end = percent_to_pixel(region[3], height)
-        return screenshot[y_start:y_end, x_start:x_end]
-
-    def find_nearby_color(self,image: np.ndarray, center_point: tuple, target_color: tuple):
+    def _load_ocr(self):
         """
-        在指定点周围搜索近似颜色像素
-        
-        参数：
-        image : 输入图像（HWC格式的RGB数组）
-        center_point : 中心坐标 (x, y)
-        target_color : 目标颜色 (R, G, B)
-        
-        返回：
-        如果return_positions为False，返回是否存在布尔值
-        如果return_positions为True，返回匹配坐标列表
+        创建并预热OCR：优先使用字形模板识别数字，置信度不足时才用PaddleOCR
+        PaddleOCR在后台加载，启动和模板能识别的帧不必等待模型
         """
-        h, w = image.shape[:2]
-        x, y = center_point
-        if not (0 <= y < h and 0 <= x < w):
-            raise ValueError("中心点坐标超出图像范围")
-        
-        # 计算颜色容差范围（每个通道±1）
-        lower_bound = np.array(target_color) - 1
-        upper_bound = np.array(target_color) + 1
-        
-        # 获取搜索区域（自动处理边界）
-        y_start = max(0, y - 1)
-        y_end = min(h, y + 2)
-        x_start = max(0, x - 1)
-        x_end = min(w, x + 2)
-        
-        # 提取区域
-        region = image[y_start:y_end, x_start:x_end]
-        # print("检测范围：",region)
-        mask = np.ones(region.shape[:2], dtype=bool)
-        
-        # 创建颜色匹配掩模
-        color_mask = np.all(
-            (region >= lower_bound) & (region <= upper_bound),
-            axis=-1
+        if self.ocr is not None:
+            # 外部传入的共享识别器由创建方负责统计
+            self.ocr.warm_up()
+            self.ocr_cache = OCRCache(self.ocr)
+            return
+        engine_factory = self.ocr_factory or DEFAULT_OCR_FACTORY
+        if self.ocr_workers > 0:
+            ocr = OCRWorkerPool(engine_factory, workers=self.ocr_workers)
+        else:
+            ocr = engine_factory()
+        ocr.warm_up()
+        instrument(ocr, 'recognize_lines', self.metrics, 'ocr_engine')
+        self.ocr = ocr
+        self.ocr_cache = OCRCache(ocr)
+
+    def _discover_window(self):
+        """启动时查找窗口，找不到时由检测循环继续重试"""
+        try:
+            self._ensure_capture()
+        except RuntimeError as e:
+            print(f"窗口查找失败: {str(e)}")
+
+    async def _timed(self, name, awaitable):
+        """等待启动步骤并记录耗时"""
+        start = time.perf_counter()
+        result = await awaitable
+        self.startup_stats[name] = time.perf_counter() - start
+        return result
+
+    async def startup(self):
+        """
+        并发启动：OCR模型加载、窗口查找、蓝牙扫描连接同时进行
+        总耗时取决于最慢的一步而不是各步之和
+        """
+        loop = asyncio.get_running_loop()
+        self._startup_begin = time.perf_counter()
+        await asyncio.gather(
+            self._timed('ocr_load', loop.run_in_executor(None, self._load_ocr)),
+            self._timed('find_window', loop.run_in_executor(None, self._discover_window)),
+            self._timed('controller', self._start_contorller()),
         )
-        
-        # 应用位置掩模
-        final_mask = color_mask & mask
-        return np.any(final_mask)
-    
-    def _in_battle(self,screenshot):
-        height, width = screenshot.shape[:2]
-        x = int(round(width * 5.37 / 100))
-        y = int(round(height * 9.86 / 100)) # 根据关卡内齿轮按钮是否存在判断是否在关卡内
-        # print(f"监测点：{x},{y}")
-        return self.find_nearby_color(screenshot,(x,y),(140,140,140))
-    
-    def _in_rouge(self,screenshot):
-        height, width = screenshot.shape[:2]
-        x = int(round(width * 1.94 / 100))
-        y = int(round(height * 5.88 / 100)) # 根据肉鸽退出按钮是否存在判断是否在肉鸽页面
-        # print(f"监测点：{x},{y}")
-        return self.find_nearby_color(screenshot,(x,y),(0,0,92))
-    
+        self.startup_stats['total'] = time.perf_counter() - self._startup_begin
+        for exporter in self._exporters:
+            exporter.start()
+        print("启动耗时：", {name: round(seconds, 3) for name, seconds in self.startup_stats.items()})
+
     async def _start_contorller(self):
-        self.controller = CoyoteBluetoothController()
+        if self.controller is None:
+            self.controller = CoyoteBluetoothController(waveform_file=WAVEFORM_FILE, address_cache=BLE_ADDRESS_CACHE)
+        self.controller.on_strength_written = self._strength_written
         await self.controller.connect()
         await self.controller.set_waveform( 
             [10, 20, 30, 40],  # 输入频率会自动转换
             [20, 40, 60, 80])
         print("蓝牙连接中，成功会电一下")
         await self.controller.set_absolute_strength(20)
+        self.controller.start_streaming()
+        # 流式发送后set_absolute_strength只更新目标，真正的蓝牙写入在调度器的_send_frame中
+        write = '_send_frame' if hasattr(self.controller, '_send_frame') else 'set_absolute_strength'
+        instrument(self.controller, write, self.metrics, 'controller_write')
     
-    async def _refresh_contorller(self):
-        strength = 5
-        if self.life == 1:
-            strength = 20
-        else:
-            strength += int(10*((self.max_life-self.life)/self.max_life)) # 目标生命影响
-        strength += self.damage*2 # 局内漏怪
-        strength *= (1 + 0.2*self.load) # 负荷影响
-        await self.controller.set_absolute_strength(int(strength))
+    def _strength_written(self, stamp):
+        """控制器真正写入强度后回调：从截图开始到蓝牙写入完成的端到端延迟"""
+        frame_time, scene = stamp
+        self.metrics.record('end_to_end', time.perf_counter() - frame_time, scene)
+
+    async def _refresh_contorller(self, stamp=None):
+        # 强度公式在规则文件中，结果已限制在规则给定的范围内
+        values = {name: getattr(self, name) for name in GAME_VALUES}
+        strength = self.plan.strength(dict(values, scene=self._scene_hint))
+        # 流式发送时这里只更新目标，端到端延迟在下一个时隙写入后由_strength_written记录
+        await self.controller.set_absolute_strength(int(strength), stamp)
         print(f"当前状态：目标生命{self.life}/{self.max_life},负荷状态：{self.load},漏怪数：{self.damage}")
         print("当前强度为：",int(strength))
 
-    def _preprocess_for_ocr(self,image):
-        gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        target_size = (gray_image.shape[1]*3,gray_image.shape[0]*3)
-    
-        # 执行缩放（自动处理尺寸顺序）
-        resized_image = cv2.resize(
-            src=gray_image,
-            dsize=target_size,  # (width, height)
-            interpolation=cv2.INTER_CUBIC
-        )
-        cv2.imwrite("test.png",resized_image)
-        return resized_image
-    
+    def _preprocess_for_ocr(self, name, image):
+        """按区域配置预处理，输出为复用缓冲区"""
+        with self.metrics.timer('preprocess'):
+            processed = self.plan.preprocessors[name](image)
+        if self.debug:
+            self.debug.record('ocr', {name: processed})
+        return processed
 
-    async def _detection_loop(self):
-        """检测主循环"""
+    def _classify(self, regions, scene_plan) -> dict:
+        """
+        场景分类，只做颜色探针判断
+        
+        先用上一帧场景的计划判断；场景变化时按新场景的计划补抓一次（roi模式）再判断
+        :return: {'scene': 场景名或None, 'values': 探针决定的游戏数据, 'ocr': (区域名, 区域图像拷贝) 或 None,
+                  'probes': 各探针命中情况}
+        """
+        state = self._probe_state(regions, scene_plan)
+        scene = self.plan.scene_of(state)
+        if scene != scene_plan.name:
+            scene_plan = self.plan.scenes[scene]
+            regions = self.capture_regions(scene_plan) if self.capture_mode == 'roi' else self._crop_areas(scene_plan)
+            state = self._probe_state(regions, scene_plan)
+        self._scene_hint = scene
+        if scene_plan.title:
+            print(scene_plan.title)
+        return scene_plan.classify(state, regions)
+
+    def _grab_and_classify(self) -> dict:
+        """截图 + 场景分类，在截图线程中执行；画面没有变化时返回None"""
+        scene_plan = self._current_scene_plan()
+        with self.metrics.timer('capture') as capture_timer:
+            regions = self.capture_regions(scene_plan)
+        if self.debug:
+            self.debug.record('frame', regions if self.last_frame is None else {'frame': self.last_frame})
+        if self.diff_gate is not None and not self.estimator.pending():
+            # 有待确认的数据时不跳帧，尽快完成确认
+            images = list(regions.values())
+            if self.last_frame is not None:
+                # 整帧降采样会把探针附近的小变化平均掉，探针区域单独参与比较
+                images.append(self.last_frame)
+                images.extend(self._crop_probes(scene_plan))
+            if not self.diff_gate.changed(images):
+                return None
+        with self.metrics.timer('classify') as classify_timer:
+            frame = self._classify(regions, scene_plan)
+            classify_timer.scene = frame['scene'] or 'idle'
+        # 截图时还不知道场景，分类后补记到场景直方图
+        self.metrics.histogram('capture', classify_timer.scene).record(capture_timer.elapsed)
+        self._filter_ocr(frame)
+        return frame
+
+    def _filter_ocr(self, frame):
+        """只在区域可能变化时保留本帧的OCR请求，触发原因记在frame['trigger']"""
+        area, image = frame['ocr'] or (None, None)
+        pending = area is not None and self.estimator.pending(self.plan.area_values[area])
+        frame['trigger'] = self.ocr_trigger.check(frame['scene'], area, image, pending)
+        if frame['trigger'] is None:
+            frame['ocr'] = None
+
+    def _read_ocr(self, name, area, scene=None, refresh=False) -> list:
+        """
+        OCR识别，在OCR线程中执行
+        :param refresh: 不使用缓存结果；确认待定数据的读数必须来自新的一次识别，否则缓存中的误读会被当作一致读数
+        """
+        with self.metrics.timer('ocr', scene):
+            return self.ocr_cache.recognize_lines([area], partial(self._preprocess_for_ocr, name), refresh)[0]
+
+    def _apply_ocr(self, name, results) -> dict:
+        """
+        把识别结果按规则解析后交给状态估计，确认后才写入游戏数据
+        :return: 本次确认改变的数据
+        """
+        values = self.plan.parse(name, results)
+        if not values:
+            return {}
+        confidence = min(confidence for _, confidence in results)
+        changed = self.estimator.observe(values, confidence)
+        for key, value in changed.items():
+            setattr(self, key, value)
+        return changed
+
+    async def _capture_stage(self):
+        """截图/分类阶段：按检测间隔取帧，分类结果立即交给控制阶段，需要识别的区域交给OCR阶段"""
+        loop = asyncio.get_running_loop()
         while not self._stop_event.is_set():
-            start_time = time.time()
+            self._check_rules()
+            start_time = time.perf_counter()
             try:
-                screenshot = self.capture_window()
-                height, width = screenshot.shape[:2]
-                if screenshot is None:
-                    continue
-                cv2.imwrite('temp.png',screenshot)
-                if self._in_battle(screenshot):
-                    print("战斗中")
-                    x = int(round(width * 66.83 / 100))
-                    y = int(round(height * 6.92 / 100)) # 判断是否有漏怪图标
-                    if self.find_nearby_color(screenshot,(x,y),(0,0,164)):
-                        area = self._get_area_by_percantage(screenshot,(64.45,69.65,5.56,7.90))
-                        try:
-                            results = self.ocr.recognize(self._preprocess_for_ocr(area))
-                            for text,_ in results:
-                                if 'X' not in text:
-                                    # print("漏怪数为：",text)
-                                    self.damage = abs(int(text))
-                        except Exception as e:
-                            print("OCR检测出错:", e,"异常结果为:",results )
-                elif self._in_rouge(screenshot):
-                    print("地图中")
-                    life_area = self._get_area_by_percantage(screenshot,(12.51,23.34,4.91,11.76))
-                    results = self.ocr.recognize(self._preprocess_for_ocr(life_area))
-                    for text,_ in results:
-                        if '/' in text:
-                            nums = re.findall(r'\d+', text)
-                            if len(nums) >= 2:
-                                n, m = map(int, nums[:2])
-                                self.life = min(n,m) # 从目标生命区提取当前生命
-                                self.max_life = max(n,m) # 从目标生命区提取生命上限
-                    x = int(round(width * 55.88 / 100))
-                    y = int(round(height * 93.58 / 100)) # 判断是否有漏怪图标
-                    if self.find_nearby_color(screenshot,(x,y),(72,94,24)):
-                        self.load = 0
-                    elif self.find_nearby_color(screenshot,(x,y),(38,77,100)):
-                        self.load = 1
-                    elif self.find_nearby_color(screenshot,(x,y),(32,33,98)):
-                        self.load = 2
-                    else:
-                        self.load = 0
-
-                await self._refresh_contorller()
-                
-                # 性能统计
-                process_time = time.time() - start_time
-                self.average_process_time = (
-                    self.average_process_time * self.frame_count + process_time
-                ) / (self.frame_count + 1)
-                self.frame_count += 1
-
-                # 动态调整间隔
-                adjusted_interval = max(0, self.check_interval - process_time)
-                time.sleep(adjusted_interval)
-                
+                frame = await loop.run_in_executor(self._capture_executor, self._grab_and_classify)
             except Exception as e:
                 print(f"检测出错: {str(e)}")
-                time.sleep(5)
+                await asyncio.sleep(5)
+                continue
+            if frame is None:
+                # 画面没有变化，沿用上一次的状态
+                await asyncio.sleep(max(0, self.scheduler.next_interval(changed=False) - (time.perf_counter() - start_time)))
+                continue
+            frame['time'] = start_time
+            for name, value in self.estimator.observe(frame['values']).items():
+                setattr(self, name, value)
+            self._control_queue.put((start_time, frame['scene'] or 'idle'))
+            if frame['ocr'] is not None:
+                self._ocr_queue.put(frame)
+
+            # 性能统计
+            process_time = time.perf_counter() - start_time
+            self.average_process_time = (
+                self.average_process_time * self.frame_count + process_time
+            ) / (self.frame_count + 1)
+            self.frame_count += 1
+
+            # 按场景调整间隔
+            await asyncio.sleep(max(0, self.scheduler.next_interval(frame['scene']) - process_time))
+
+    async def _run_ocr(self, frame, slots):
+        """识别一帧的OCR区域，结果比已写入的更旧时丢弃"""
+        loop = asyncio.get_running_loop()
+        name, area = frame['ocr']
+        results = None
+        try:
+            scene = frame['scene'] or 'idle'
+            refresh = frame.get('trigger') == 'pending'
+            results = await loop.run_in_executor(self._ocr_executor, self._read_ocr, name, area, scene, refresh)
+            if frame['time'] < self._ocr_applied.get(name, 0):
+                return
+            changed = self._apply_ocr(name, results)
+            self._ocr_applied[name] = frame['time']
+        except Exception as e:
+            print("OCR检测出错:", e,"异常结果为:",results )
+            if self.debug:
+                self.debug.dump("ocr_error")
+            return
+        finally:
+            slots.release()
+        if changed:
+            self._control_queue.put((frame['time'], scene))
+
+    async def _ocr_stage(self):
+        """OCR阶段：只处理最新一帧，积压的旧帧直接丢弃；使用进程池时可同时识别多帧"""
+        slots = asyncio.Semaphore(self._ocr_concurrency)
+        tasks = set()
+        while not self._stop_event.is_set():
+            try:
+                frame = await self._ocr_queue.get(timeout=self.check_interval)
+            except asyncio.TimeoutError:
+                continue
+            await slots.acquire()
+            task = asyncio.create_task(self._run_ocr(frame, slots))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def _control_stage(self):
+        """控制阶段：合并积压的更新，只按最新状态写一次蓝牙"""
+        while not self._stop_event.is_set():
+            try:
+                frame_time, scene = await self._control_queue.get(timeout=self.check_interval)
+            except asyncio.TimeoutError:
+                continue
+            try:
+                with self.metrics.timer('control', scene):
+                    await self._refresh_contorller((frame_time, scene))
+            except Exception as e:
+                print(f"控制器更新出错: {str(e)}")
+                continue
+            if 'first_frame' not in self.startup_stats and self._startup_begin is not None:
+                # 从开始启动到第一帧处理完成（交给控制器）的时间
+                self.startup_stats['first_frame'] = time.perf_counter() - self._startup_begin
+
+    async def _detection_loop(self):
+        """检测主循环：截图/分类 → OCR → 控制器 三个阶段并发运行"""
+        self._ocr_queue = LatestQueue()
+        self._control_queue = LatestQueue()
+        await asyncio.gather(
+            self._capture_stage(),
+            self._ocr_stage(),
+            self._control_stage(),
+        )
 
     async def start(self):
-        """启动检测线程"""
+        """启动检测任务"""
         self._stop_event.clear()
-        await self._start_contorller()
-        self.thread = Thread(target=self._detection_loop, daemon=True)
-        self.thread.start()
+        await self.startup()
+        self.task = asyncio.create_task(self._detection_loop())
 
     def stop(self):
-        """停止检测"""
+        """停止检测，各阶段在一个检测间隔内退出"""
         self._stop_event.set()
-        if self.thread.is_alive():
-            self.thread.join()
+        for exporter in self._exporters:
+            exporter.stop()
+
+    def close(self):
+        """
+        停止检测并释放自行创建的资源：OCR工作进程池或识别器（写出自学习模板）、线程池
+        应在检测循环退出后调用；外部传入的识别器和截图线程池由创建方关闭
+        """
+        self.stop()
+        self._ocr_executor.shutdown(wait=True)
+        if self._owns_ocr and self.ocr is not None and hasattr(self.ocr, 'close'):
+            self.ocr.close()
+        if self._owns_capture_executor:
+            self._capture_executor.shutdown(wait=False)
+
+    def dump_debug(self, reason: str = "manual"):
+        """把调试缓冲区中的最近帧写盘（后台线程），未开启调试时返回None"""
+        return self.debug.dump(reason) if self.debug else None
 
     def get_performance_stats(self) -> dict:
         """获取性能统计"""
         return {
             'frame_count': self.frame_count,
             'average_process_time': self.average_process_time,
+            'ocr_cache': self.ocr_cache.stats() if self.ocr_cache else None,
+            **self.metrics.summary(),
+            'dropped_frames': self._ocr_queue.dropped if self._ocr_queue else 0,
+            'ocr_pool': self.ocr.stats() if isinstance(self.ocr, OCRWorkerPool) else None,
+            'startup': self.startup_stats,
+            'geometry': self.plan.geometry_stats(),
+            'rule_reloads': self.rules.reloads,
+            'estimator': self.estimator.stats(),
+            'ocr_triggers': self.ocr_trigger.stats(),
+            'scheduler': dict(
+                self.scheduler.stats(),
+                passed=self.diff_gate.passed if self.diff_gate else self.frame_count,
+                gated=self.diff_gate.gated if self.diff_gate else 0,
+            ),
+            'capture_rebuilds': getattr(self.capture, 'rebuild_count', 0),
+            'b0_stream': self.controller.get_stream_stats() if self.controller else None,
+            'b0_ack': self.controller.get_ack_stats() if self.controller else None,
+            'ble_link': self.controller.get_link_stats() if self.controller else None,
         }
 
+class Supervisor:
+    def __init__(self, instances: list, ocr_factory=None, capture_threads: int = 1,
+                 max_batch: int = 32, max_wait: float = 0.002, **detector_kwargs):
+        """
+        同时驱动多个模拟器窗口，每个窗口对应一台郊狼
+
+        所有检测器共享一个OCR识别器（各窗口的区域合并成一次推理）和一个截图线程池
+        每个检测器同一时间最多只有一个截图请求，线程池按提交顺序执行，各窗口轮流截图
+        :param instances: [(窗口标题, 控制器对象或郊狼设备名), ...]
+        :param ocr_factory: 识别器工厂，默认为字形模板识别 + PaddleOCR兜底，只创建一次
+        :param capture_threads: 共享截图线程数
+        :param max_batch: 单次OCR推理最多合并的区域数
+        :param max_wait: 合并OCR请求的最长等待时间（秒）
+        :param detector_kwargs: 传给每个AdvancedWindowDetector的其他参数
+        """
+        if not instances:
+            raise ValueError("至少需要一个窗口")
+        self.ocr = BatchingOCR(ocr_factory or DEFAULT_OCR_FACTORY, max_batch=max_batch, max_wait=max_wait)
+        self._capture_executor = ThreadPoolExecutor(max_workers=capture_threads, thread_name_prefix="capture")
+        self.detectors = []
+        for title, controller in instances:
+            if isinstance(controller, str):
+                controller = CoyoteBluetoothController(device_name=controller, waveform_file=WAVEFORM_FILE,
+                                                       address_cache=BLE_ADDRESS_CACHE)
+            self.detectors.append(AdvancedWindowDetector(
+                title, controller=controller, ocr=self.ocr,
+                capture_executor=self._capture_executor, **detector_kwargs
+            ))
+
+    async def startup(self):
+        """并发启动所有检测器，共享识别器只加载一次"""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            loop.run_in_executor(None, self.ocr.warm_up),
+            *(detector.startup() for detector in self.detectors),
+        )
+
+    async def run(self):
+        """运行所有检测器的检测循环，直到stop"""
+        for detector in self.detectors:
+            detector._stop_event.clear()
+        await asyncio.gather(*(detector._detection_loop() for detector in self.detectors))
+
+    def stop(self):
+        for detector in self.detectors:
+            detector.stop()
+
+    def close(self):
+        self.stop()
+        self.ocr.close()
+        self._capture_executor.shutdown(wait=False)
+
+    def get_performance_stats(self) -> dict:
+        """共享识别器的合批统计 + 各窗口检测器的统计"""
+        return {
+            'ocr': self.ocr.stats(),
+            'instances': [
+                dict(detector.get_performance_stats(), window=detector.window_title)
+                for detector in self.detectors
+            ],
+        }
+
+
+# 窗口标题 -> 郊狼设备名，每个模拟器窗口控制一台郊狼
+INSTANCES = [
+    ("MuMu", "47L121000"),
+]
+
 async def main():
-    # 初始化检测器
-    detector = AdvancedWindowDetector("MuMu", check_interval = 1)
+    # 初始化检测器（多个窗口共享一个OCR识别器）
+    supervisor = Supervisor(INSTANCES, check_interval = 1, capture_mode = "roi")
     # 启动检测
-    # await detector.start()
-    detector._stop_event.clear()
-    await detector._start_contorller()
-    await detector._detection_loop()
+    await supervisor.startup()
+    try:
+        await supervisor.run()
+    finally:
+        supervisor.close()
 
         # try:
         #     while True:
@@ -0,0 +1,271 @@
+import bisect
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 固定的对数分桶上界（秒）：50us 起，每档约 x1.25，覆盖到约 30s
+BUCKET_BOUNDS = tuple(50e-6 * 1.25 ** i for i in range(61))
+
+
+class LatencyHistogram:
+    def __init__(self, bounds: tuple = BUCKET_BOUNDS):
+        """
+        固定分桶的延迟直方图，记录开销为一次二分查找
+
+        :param bounds: 各桶上界（秒），升序；超出最后一档的样本计入溢出桶
+        """
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p: float) -> float:
+        """返回第p百分位所在桶的上界（秒），溢出桶返回观测到的最大值"""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self) -> dict:
+        """统计摘要（毫秒）"""
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'p50_ms': self.percentile(50) * 1000,
+            'p95_ms': self.percentile(95) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'max_ms': self.max * 1000,
+        }
+
+
+class StageTimer:
+    def __init__(self, histogram: LatencyHistogram):
+        """with语句计时，结束时写入直方图"""
+        self.histogram = histogram
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self._start
+        self.histogram.record(self.elapsed)
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self, stages=()):
+        """
+        按阶段、按场景分别统计的延迟直方图集合
+
+        :param stages: 预先创建的阶段名，其余阶段在第一次记录时创建
+        """
+        self.stages = {}
+        self.scenes = {}   # 场景 -> {阶段: 直方图}
+        self.hooks = []
+        for stage in stages:
+            self.histogram(stage)
+
+    def histogram(self, stage: str, scene: str = None) -> LatencyHistogram:
+        histograms = self.stages if scene is None else self.scenes.setdefault(scene, {})
+        histogram = histograms.get(stage)
+        if histogram is None:
+            histogram = histograms[stage] = LatencyHistogram()
+        return histogram
+
+    def record(self, stage: str, seconds: float, scene: str = None):
+        """
+        记录一次耗时，给定场景时同时计入该场景的直方图
+        每个钩子以 (阶段, 场景, 秒数) 被调用
+        """
+        self.histogram(stage).record(seconds)
+        if scene is not None:
+            self.histogram(stage, scene).record(seconds)
+        for hook in self.hooks:
+            hook(stage, scene, seconds)
+
+    def timer(self, stage: str, scene: str = None) -> 'MetricsTimer':
+        return MetricsTimer(self, stage, scene)
+
+    def summary(self) -> dict:
+        return {
+            'stages': {stage: histogram.summary() for stage, histogram in self.stages.items()},
+            'scenes': {
+                scene: {stage: histogram.summary() for stage, histogram in histograms.items()}
+                for scene, histograms in self.scenes.items()
+            },
+        }
+
+
+class MetricsTimer:
+    def __init__(self, registry: MetricsRegistry, stage: str, scene: str = None):
+        """
+        with语句计时，结束时写入MetricsRegistry
+        场景在进入时可能还不知道（例如分类阶段），可以在with块内给scene赋值
+        """
+        self.registry = registry
+        self.stage = stage
+        self.scene = scene
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self._start
+        self.registry.record(self.stage, self.elapsed, self.scene)
+        return False
+
+
+def instrument(obj, method: str, registry: MetricsRegistry, stage: str):
+    """
+    给对象的方法（同步或async）套上计时钩子，只替换该实例上的属性，不修改类
+    :return: 原方法，便于撤销
+    """
+    original = getattr(obj, method)
+    if inspect.iscoroutinefunction(original):
+        @functools.wraps(original)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await original(*args, **kwargs)
+            finally:
+                registry.record(stage, time.perf_counter() - start)
+    else:
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                registry.record(stage, time.perf_counter() - start)
+    setattr(obj, method, wrapper)
+    return original
+
+
+class JsonlExporter:
+    def __init__(self, source, path: str = "metrics.jsonl", interval: float = 10.0,
+                 max_bytes: int = 1 << 20, backups: int = 3):
+        """
+        后台线程定期把统计快照追加到JSONL文件，超过大小后轮转（path.1, path.2 ...）
+
+        :param source: 无参可调用对象，返回可JSON序列化的统计字典
+        :param path: 输出文件
+        :param interval: 写出间隔（秒）
+        :param max_bytes: 单个文件的大小上限
+        :param backups: 保留的历史文件数
+        """
+        self.source = source
+        self.path = path
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def write(self):
+        """立即写出一条快照"""
+        line = json.dumps(dict(self.source(), time=time.time()), ensure_ascii=False, default=str)
+        if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.max_bytes:
+            self._rotate()
+        with open(self.path, 'a', encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except Exception as e:
+                print(f"统计导出出错: {e}")
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-jsonl", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class MetricsServer:
+    def __init__(self, source, host: str = "127.0.0.1", port: int = 9108):
+        """
+        本地HTTP统计接口，GET / 或 /metrics 返回JSON快照
+
+        :param source: 无参可调用对象，返回可JSON序列化的统计字典
+        :param port: 监听端口，0表示自动分配（实际端口见server_port）
+        """
+        self.source = source
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def _handler(self):
+        source = self.source
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = json.dumps(source(), ensure_ascii=False, default=str).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    @property
+    def server_port(self) -> int:
+        return self._server.server_address[1] if self._server else self.port
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = self._thread = None
@@ -1,6 +1,11 @@
-from paddleocr import PaddleOCR
+from collections import OrderedDict
+from concurrent.futures import Future
 import numpy as np
+import queue
+import threading
+import time
 import cv2
+from metrics import LatencyHistogram
 
 class FastOCR:
     def __init__(self, use_gpu=True, lang='en'):
@@ -9,6 +14,9 @@ class FastOCR:
         :param use_gpu: 是否使用GPU加速（需要安装对应版本的PaddlePaddle）
         :param lang: 语言类型 en/ch/...
         """
+        # paddle导入很慢，放到构造时再导入，启动时可与蓝牙连接并行进行
+        from paddleocr import PaddleOCR
+
         # 配置轻量模型（默认使用PP-OCRv4）
         self.ocr = PaddleOCR(
             use_angle_cls=False,  # 关闭方向分类（提升速度）
@@ -39,6 +47,241 @@ class FastOCR:
             if len(line) >= 2
         ]
 
+    def warm_up(self):
+        """用空白图像跑一次识别，提前完成推理引擎的初始化"""
+        self.recognize_lines([np.zeros((32, 96), dtype=np.uint8)])
+
+    def recognize_lines(self, images: list) -> list:
+        """
+        跳过文字检测，直接对已裁好的单行文字区域做识别
+        多张图像在一次推理中批量识别
+        :param images: 图像列表（灰度/BGR格式），每张应紧贴一行文字
+        :return: 与输入一一对应的 (文字内容, 置信度) 列表
+        """
+        if not images:
+            return []
+        batch = [
+            cv2.cvtColor(image, cv2.COLOR_GRAY2RGB) if image.ndim == 2
+            else cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            for image in images
+        ]
+
+        # 仅运行识别模型，整批送入一次推理
+        result = self.ocr.ocr(batch, det=False, rec=True, cls=False)
+        return [(text, float(score)) for text, score in result  [0]]
+
+class OCRCache:
+    def __init__(self, ocr, max_entries: int = 128, max_age: float = None,
+                 tolerance: int = 8, fingerprint_size: tuple = (16, 8)):
+        """
+        基于区域指纹的OCR结果缓存（LRU）
+
+        指纹为原始区域缩小到fingerprint_size后按tolerance量化的灰度值，
+        画面没有可见变化时直接返回上次的识别结果
+        :param ocr: 识别器，需提供recognize_lines方法
+        :param max_entries: 最大缓存条目数，超出时淘汰最久未使用的条目
+        :param max_age: 条目有效期（秒），None表示不过期
+        :param tolerance: 灰度量化步长，越大越能容忍细小抖动
+        :param fingerprint_size: 指纹尺寸 (宽, 高)
+        """
+        self.ocr = ocr
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.tolerance = tolerance
+        self.fingerprint_size = fingerprint_size
+        self._entries = OrderedDict()  # 指纹 -> (写入时间, 识别结果)
+        self._lock = threading.Lock()  # 允许多个OCR线程共用一个缓存
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def fingerprint(self, image: np.ndarray) -> tuple:
+        """计算区域指纹（区域尺寸 + 量化后的缩略图）"""
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY if image.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(image, self.fingerprint_size, interpolation=cv2.INTER_AREA)
+        return image.shape[:2] + ((small // self.tolerance).tobytes(),)
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, results = entry
+        if self.max_age is not None and time.monotonic() - stored_at > self.max_age:
+            del self._entries[key]
+            self.evictions += 1
+            return None
+        self._entries.move_to_end(key)
+        return results
+
+    def _store(self, key, results):
+        self._entries[key] = (time.monotonic(), results)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def recognize_lines(self, images: list, preprocess=None, refresh: bool = False) -> list:
+        """
+        带缓存的批量识别
+        :param images: 原始区域图像列表（指纹基于原始像素计算）
+        :param preprocess: 可选的预处理函数，仅对未命中的区域调用
+        :param refresh: 为True时不查缓存，重新识别并更新缓存（需要独立的一次识别时使用）
+        :return: 与输入一一对应的识别结果列表，每个元素为 [(文字内容, 置信度)]
+        """
+        keys = [self.fingerprint(image) for image in images]
+        with self._lock:
+            results = [None if refresh else self._lookup(key) for key in keys]
+            missing = [i for i, result in enumerate(results) if result is None]
+            self.hits += len(images) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            batch = [images[i] if preprocess is None else preprocess(images[i]) for i in missing]
+            lines = self.ocr.recognize_lines(batch)
+            with self._lock:
+                for i, line in zip(missing, lines):
+                    results[i] = [line]
+                    self._store(keys[i], results[i])
+        return results
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """缓存命中统计"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._entries),
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+class BatchingOCR:
+    def __init__(self, engine, max_batch: int = 32, max_wait: float = 0.002):
+        """
+        多个检测器共享的识别器，接口与FastOCR一致
+
+        各调用线程提交的区域由一个分发线程收集，短时间内到达的请求合并成一次recognize_lines推理
+        :param engine: 识别器，或返回识别器的无参工厂（warm_up或首次识别时才创建，只创建一次）
+        :param max_batch: 单次推理最多合并的图像数
+        :param max_wait: 收到第一个请求后等待其他请求的最长时间（秒）
+        """
+        self._engine = engine
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._thread = None
+        self._warm = False
+        self.requests = 0
+        self.batches = 0
+        self.images = 0
+        self.latency = LatencyHistogram()
+
+    @property
+    def engine(self):
+        with self._lock:
+            if isinstance(self._engine, type) or not hasattr(self._engine, 'recognize_lines'):
+                self._engine = self._engine()
+            return self._engine
+
+    def warm_up(self):
+        """创建并预热底层识别器，多个检测器同时调用时只预热一次"""
+        engine = self.engine
+        with self._lock:
+            if self._warm:
+                return
+            if hasattr(engine, 'warm_up'):
+                engine.warm_up()
+            self._warm = True
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ocr-batch", daemon=True)
+                self._thread.start()
+
+    def recognize_lines(self, images: list) -> list:
+        """
+        阻塞式批量识别，可在多个线程中同时调用
+        :return: 与输入一一对应的 (文字内容, 置信度) 列表
+        """
+        if not images:
+            return []
+        self._ensure_thread()
+        future = Future()
+        self._requests.put((list(images), future))
+        return future.result()
+
+    def _collect(self, first) -> list:
+        """从第一个请求开始，在max_wait内尽量多收集请求"""
+        batch = [first]
+        count = len(first[0])
+        deadline = time.perf_counter() + self.max_wait
+        while count < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                request = self._requests.get(timeout=remaining) if remaining > 0 else self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                self._requests.put(None)
+                break
+            batch.append(request)
+            count += len(request[0])
+        return batch
+
+    def _run(self):
+        engine = self.engine
+        while True:
+            first = self._requests.get()
+            if first is None:
+                break
+            batch = self._collect(first)
+            images = [image for request_images, _ in batch for image in request_images]
+            start = time.perf_counter()
+            try:
+                results = engine.recognize_lines(images)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            finally:
+                self.latency.record(time.perf_counter() - start)
+            self.requests += len(batch)
+            self.batches += 1
+            self.images += len(images)
+            position = 0
+            for request_images, future in batch:
+                future.set_result(results[position:position + len(request_images)])
+                position += len(request_images)
+
+    def recognize(self, image: np.ndarray) -> list:
+        text, confidence = self.recognize_lines([image])[0]
+        return [(text, confidence)] if text else []
+
+    def stats(self) -> dict:
+        """合批统计：请求数、推理次数、平均每次推理的图像数和推理延迟"""
+        return {
+            'requests': self.requests,
+            'batches': self.batches,
+            'mean_batch': self.images / self.batches if self.batches else 0.0,
+            'latency': self.latency.summary(),
+        }
+
+    def close(self):
+        self._requests.put(None)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        engine = self._engine
+        if not isinstance(engine, type) and hasattr(engine, 'recognize_lines') and hasattr(engine, 'close'):
+            engine.close()
+
 # 使用示例
 if __name__ == "__main__":
     # 初始化识别器（首次运行会自动下载模型）
@@ -0,0 +1,209 @@
+import asyncio
+import multiprocessing as mp
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from metrics import LatencyHistogram
+
+
+def _worker_main(factory, shm_name, conn):
+    """工作进程入口：加载一次模型，之后循环处理共享内存中的图像"""
+    engine = factory()
+    if hasattr(engine, 'warm_up'):
+        engine.warm_up()
+    shm = SharedMemory(name=shm_name)
+    conn.send(('ready', None))
+    try:
+        while True:
+            layouts = conn.recv()
+            if layouts is None:
+                break
+            images = [
+                np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+                for offset, shape, dtype in layouts
+            ]
+            try:
+                conn.send(('ok', engine.recognize_lines(images)))
+            except Exception as e:
+                conn.send(('error', repr(e)))
+            del images
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        shm.close()
+        if hasattr(engine, 'close'):
+            engine.close()
+
+
+class _Worker:
+    def __init__(self, ctx, factory, slot_bytes):
+        """单个OCR工作进程及其共享内存槽"""
+        self.shm = SharedMemory(create=True, size=slot_bytes)
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main, args=(factory, self.shm.name, child_conn), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    def _recv(self, timeout):
+        if not self.conn.poll(timeout):
+            raise TimeoutError("OCR工作进程响应超时")
+        return self.conn.recv()
+
+    def wait_ready(self, timeout: float):
+        """等待工作进程完成模型加载"""
+        if not self.ready:
+            self._recv(timeout)
+            self.ready = True
+
+    def call(self, images: list, timeout: float, start_timeout: float) -> list:
+        self.wait_ready(start_timeout)
+
+        # 图像按8字节对齐依次写入共享内存，只通过管道传递布局信息
+        layouts = []
+        offset = 0
+        for image in images:
+            image = np.ascontiguousarray(image)
+            end = offset + image.nbytes
+            if end > self.shm.size:
+                raise ValueError(f"图像总大小超出共享内存槽（{self.shm.size}字节）")
+            np.ndarray(image.shape, dtype=image.dtype, buffer=self.shm.buf, offset=offset)[...] = image
+            layouts.append((offset, image.shape, image.dtype.str))
+            offset = (end + 7) & ~7
+
+        self.conn.send(layouts)
+        status, payload = self._recv(timeout)
+        if status != 'ok':
+            raise RuntimeError(f"OCR工作进程识别出错: {payload}")
+        return payload
+
+    def close(self):
+        try:
+            if self.process.is_alive():
+                self.conn.send(None)
+                self.process.join(1)
+        except (OSError, ValueError):
+            pass
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+        self.shm.close()
+        self.shm.unlink()
+
+
+class OCRWorkerPool:
+    def __init__(self, factory, workers: int = 2, slot_bytes: int = 8 << 20,
+                 timeout: float = 30.0, start_timeout: float = 120.0):
+        """
+        进程外OCR识别池，接口与FastOCR一致
+
+        每个工作进程启动时调用一次factory加载模型，图像经共享内存传入，不做pickle
+        工作进程崩溃或超时会自动重启，识别请求抛出异常但不影响主进程
+        :param factory: 可pickle的无参可调用对象，返回提供recognize_lines的识别器
+        :param workers: 工作进程数，即可同时进行的识别请求数
+        :param slot_bytes: 每个工作进程的共享内存大小
+        :param timeout: 单次识别超时（秒）
+        :param start_timeout: 等待模型加载的超时（秒）
+        """
+        self._ctx = mp.get_context('spawn')
+        self._factory = factory
+        self._slot_bytes = slot_bytes
+        self.timeout = timeout
+        self.start_timeout = start_timeout
+        self._workers = [_Worker(self._ctx, factory, slot_bytes) for _ in range(workers)]
+        self._idle = queue.Queue()
+        for worker in self._workers:
+            self._idle.put(worker)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr-pool")
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.in_flight = 0
+        self.restarts = 0
+        self.latency = LatencyHistogram()
+
+    @property
+    def size(self) -> int:
+        return len(self._workers)
+
+    def _restart(self, worker: _Worker) -> _Worker:
+        try:
+            worker.close()
+        except Exception:
+            pass
+        replacement = _Worker(self._ctx, self._factory, self._slot_bytes)
+        with self._lock:
+            self._workers[self._workers.index(worker)] = replacement
+            self.restarts += 1
+        return replacement
+
+    def warm_up(self):
+        """阻塞直到所有工作进程完成模型加载"""
+        workers = [self._idle.get() for _ in range(self.size)]
+        try:
+            for i, worker in enumerate(workers):
+                try:
+                    worker.wait_ready(self.start_timeout)
+                except (TimeoutError, EOFError, OSError):
+                    workers[i] = self._restart(worker)
+        finally:
+            for worker in workers:
+                self._idle.put(worker)
+
+    def recognize_lines(self, images: list) -> list:
+        """
+        阻塞式批量识别，可在多个线程中同时调用
+        :return: 与输入一一对应的 (文字内容, 置信度) 列表
+        """
+        with self._lock:
+            self.waiting += 1
+        worker = self._idle.get()
+        with self._lock:
+            self.waiting -= 1
+            self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            if not worker.process.is_alive():
+                worker = self._restart(worker)
+            try:
+                return worker.call(images, self.timeout, self.start_timeout)
+            except (TimeoutError, EOFError, OSError) as e:
+                worker = self._restart(worker)
+                raise RuntimeError(f"OCR工作进程异常，已重启: {e}")
+        finally:
+            self.latency.record(time.perf_counter() - start)
+            with self._lock:
+                self.in_flight -= 1
+            self._idle.put(worker)
+
+    async def recognize_lines_async(self, images: list) -> list:
+        """异步批量识别，最多同时有workers个请求在执行"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.recognize_lines, images)
+
+    def recognize(self, image: np.ndarray) -> list:
+        text, confidence = self.recognize_lines([image])[0]
+        return [(text, confidence)] if text else []
+
+    def stats(self) -> dict:
+        """队列深度、在途请求数、重启次数和识别延迟"""
+        return {
+            'workers': self.size,
+            'alive': sum(worker.process.is_alive() for worker in self._workers),
+            'queue_depth': self.waiting,
+            'in_flight': self.in_flight,
+            'restarts': self.restarts,
+            'latency': self.latency.summary(),
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        for worker in self._workers:
+            worker.close()
@@ -0,0 +1,38 @@
+import asyncio
+
+
+class LatestQueue:
+    def __init__(self):
+        """
+        容量为1的“最新值优先”队列
+
+        put不会阻塞：队列里还有未取走的旧值时直接覆盖，并计入dropped，
+        保证下游阶段总是处理最新的一帧而不是排队的旧帧
+        """
+        self._item = None
+        self._has_item = False
+        self._event = asyncio.Event()
+        self.dropped = 0
+
+    def put(self, item):
+        if self._has_item:
+            self.dropped += 1
+        self._item = item
+        self._has_item = True
+        self._event.set()
+
+    async def get(self, timeout: float = None):
+        """
+        取出最新值
+        :param timeout: 超时（秒），超时抛出asyncio.TimeoutError
+        """
+        while not self._has_item:
+            self._event.clear()
+            await asyncio.wait_for(self._event.wait(), timeout)
+        item = self._item
+        self._item = None
+        self._has_item = False
+        return item
+
+    def empty(self) -> bool:
+        return not self._has_item
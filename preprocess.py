@@ -0,0 +1,129 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from geometry import area_bounds
+
+# 规则文件中的插值方式名称
+INTERPOLATIONS = {
+    'nearest': cv2.INTER_NEAREST,
+    'linear': cv2.INTER_LINEAR,
+    'cubic': cv2.INTER_CUBIC,
+    'area': cv2.INTER_AREA,
+    'lanczos': cv2.INTER_LANCZOS4,
+}
+
+
+class OCRPreprocessor:
+    def __init__(self, scale: float = 3.0, interpolation: int = cv2.INTER_CUBIC, binarize: bool = False):
+        """
+        单个OCR区域的预处理：转灰度 → 缩放 → 可选的Otsu二值化
+
+        输出写入按区域尺寸预分配的缓冲区（每个线程一份），
+        返回的数组在同一线程下一次调用前有效，需要保留请自行copy()
+        :param scale: 缩放倍数，1表示不缩放
+        :param interpolation: OpenCV插值方式
+        :param binarize: 是否做Otsu二值化（白底黑字或黑底白字都保持原极性）
+        """
+        self.scale = scale
+        self.interpolation = interpolation
+        self.binarize = binarize
+        self._local = threading.local()
+
+    def _buffers(self, height: int, width: int) -> tuple:
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        entry = buffers.get((height, width))
+        if entry is None:
+            gray = np.empty((height, width), dtype=np.uint8)
+            size = (max(1, int(round(width * self.scale))), max(1, int(round(height * self.scale))))
+            output = gray if size == (width, height) else np.empty((size[1], size[0]), dtype=np.uint8)
+            entry = buffers[(height, width)] = (gray, output)
+        return entry
+
+    def __call__(self, image: np.ndarray) -> np.ndarray:
+        height, width = image.shape[:2]
+        gray, output = self._buffers(height, width)
+        if image.ndim == 2:
+            np.copyto(gray, image)
+        else:
+            cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY if image.shape[2] == 4 else cv2.COLOR_BGR2GRAY, dst=gray)
+        if output is not gray:
+            cv2.resize(gray, (output.shape[1], output.shape[0]), dst=output, interpolation=self.interpolation)
+        if self.binarize:
+            cv2.threshold(output, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=output)
+        return output
+
+    def __repr__(self):
+        return f"OCRPreprocessor(scale={self.scale}, interpolation={self.interpolation}, binarize={self.binarize})"
+
+
+def crops_from_recording(recording, areas: dict) -> dict:
+    """
+    从带标注的录像中裁出各OCR区域
+    :param areas: {名称: (x起%, x止%, y起%, y止%)}
+    :return: {名称: [(区域图像, 标注文字), ...]}
+    """
+    crops = {}
+    for i, labels in sorted(recording.labels.items()):
+        frame = recording.frame(i)
+        height, width = frame.shape[:2]
+        for name, text in labels.items():
+            if name not in areas:
+                continue
+            x_start, x_end, y_start, y_end = area_bounds(areas[name], width, height)
+            crops.setdefault(name, []).append((np.array(frame[y_start:y_end, x_start:x_end]), str(text)))
+    return crops
+
+
+def calibrate(engine, samples: list, scales=(1.0, 1.5, 2.0, 2.5, 3.0),
+              interpolations=(cv2.INTER_LINEAR, cv2.INTER_CUBIC), binarize=(False, True)) -> dict:
+    """
+    在标注样本上尝试各种预处理参数，找出识别结果与最佳准确率一致的最小缩放倍数
+
+    :param engine: 提供recognize_lines的识别器（建议关闭自学习，避免标定时改写模板）
+    :param samples: [(区域图像, 标注文字), ...]
+    :return: {'best': OCRPreprocessor, 'accuracy': 准确率, 'results': [(参数, 准确率, 每张耗时秒), ...]}
+    """
+    results = []
+    for scale in scales:
+        for interpolation in interpolations:
+            for binary in binarize:
+                preprocessor = OCRPreprocessor(scale, interpolation, binary)
+                start = time.perf_counter()
+                batch = [preprocessor(image).copy() for image, _ in samples]
+                lines = engine.recognize_lines(batch)
+                elapsed = (time.perf_counter() - start) / len(samples)
+                correct = sum(
+                    text.replace(" ", "") == label.replace(" ", "")
+                    for (text, _), (_, label) in zip(lines, samples)
+                )
+                results.append((preprocessor, correct / len(samples), elapsed))
+    best_accuracy = max(accuracy for _, accuracy, _ in results)
+    # 准确率与最佳一致的参数中，取缩放最小、其次耗时最少的
+    best = min(
+        (entry for entry in results if entry[1] >= best_accuracy),
+        key=lambda entry: (entry[0].scale, entry[2]),
+    )
+    return {'best': best[0], 'accuracy': best_accuracy, 'results': results}
+
+
+# 使用示例：python preprocess.py <录像目录>
+if __name__ == "__main__":
+    import sys
+    from functools import partial
+    from digit_ocr import DigitOCR
+    from ocr import FastOCR
+    from recording import Recording
+    from rules import load_rules
+
+    names = {flag: name for name, flag in INTERPOLATIONS.items()}
+    engine = DigitOCR(templates="digit_templates.npz", fallback=partial(FastOCR, lang="ch"), auto_learn=False)
+    for name, samples in crops_from_recording(Recording(sys.argv[1]), load_rules("rules.json").areas).items():
+        result = calibrate(engine, samples)
+        best = result['best']
+        print(f"{name}: {len(samples)}个样本，准确率{result['accuracy']:.1%}，rules.json中可设为 "
+              f'"scale": {best.scale}, "interpolation": "{names[best.interpolation]}", "binarize": {str(best.binarize).lower()}')
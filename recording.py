@@ -0,0 +1,230 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from capture import CaptureBackend, copy_regions
+
+# 录像目录结构：
+#   frames.raw   所有帧的原始BGRX像素依次拼接
+#   index.npy    每帧一条记录（偏移、时间戳、宽、高）
+#   labels.json  可选的人工标注 {"帧序号": {"区域名": "文字"}}，用于统计OCR准确率
+FRAMES_FILE = "frames.raw"
+INDEX_FILE = "index.npy"
+LABELS_FILE = "labels.json"
+INDEX_DTYPE = np.dtype([('offset', '<u8'), ('time', '<f8'), ('width', '<u4'), ('height', '<u4')])
+
+
+class SessionRecorder:
+    def __init__(self, path: str):
+        """
+        把截图写入录像目录，帧数据直接追加到frames.raw，索引在close时写出
+
+        :param path: 录像目录，不存在时自动创建
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self._file = open(os.path.join(path, FRAMES_FILE), 'wb')
+        self._index = []
+        self._offset = 0
+        self._start = None
+
+    def write(self, frame: np.ndarray, timestamp: float = None):
+        """
+        追加一帧
+        :param frame: HxWx4 BGRX 或 HxWx3 BGR 截图
+        :param timestamp: 时间戳（秒），默认使用perf_counter，保存为相对第一帧的时间
+        """
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        if self._start is None:
+            self._start = timestamp
+        height, width = frame.shape[:2]
+        if frame.shape[2] == 3:
+            bgrx = np.empty((height, width, 4), dtype=np.uint8)
+            bgrx[:, :, :3] = frame
+            bgrx[:, :, 3] = 255
+            frame = bgrx
+        data = np.ascontiguousarray(frame, dtype=np.uint8)
+        self._file.write(data.data)
+        self._index.append((self._offset, timestamp - self._start, width, height))
+        self._offset += data.nbytes
+
+    def __len__(self):
+        return len(self._index)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.close()
+        np.save(os.path.join(self.path, INDEX_FILE), np.array(self._index, dtype=INDEX_DTYPE))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class Recording:
+    def __init__(self, path: str):
+        """
+        只读打开录像，帧数据通过内存映射按需读取
+
+        :param path: 录像目录
+        """
+        self.path = path
+        self.index = np.load(os.path.join(path, INDEX_FILE))
+        self._data = np.memmap(os.path.join(path, FRAMES_FILE), dtype=np.uint8, mode='r') if len(self.index) else None
+        labels_path = os.path.join(path, LABELS_FILE)
+        self.labels = {}
+        if os.path.exists(labels_path):
+            with open(labels_path, encoding="utf-8") as f:
+                self.labels = {int(i): areas for i, areas in json.load(f).items()}
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self.index['time']
+
+    @property
+    def duration(self) -> float:
+        return float(self.index['time'][-1]) if len(self.index) else 0.0
+
+    def frame(self, i: int) -> np.ndarray:
+        """第i帧的只读 HxWx4 视图"""
+        offset, _, width, height = self.index[i]
+        size = int(width) * int(height) * 4
+        return self._data[int(offset):int(offset) + size].reshape(int(height), int(width), 4)
+
+    def save_labels(self, labels: dict):
+        """写入标注 {帧序号: {区域名: 文字}}"""
+        self.labels = {int(i): areas for i, areas in labels.items()}
+        with open(os.path.join(self.path, LABELS_FILE), 'w', encoding="utf-8") as f:
+            json.dump({str(i): areas for i, areas in sorted(self.labels.items())}, f, ensure_ascii=False, indent=1)
+
+
+class RecordingCaptureSession(CaptureBackend):
+    def __init__(self, backend: CaptureBackend, recorder: SessionRecorder):
+        """包装另一个画面源，把每次整帧抓取的结果写入录像（ROI抓取也会先整帧抓取）"""
+        self.backend = backend
+        self.recorder = recorder
+
+    def grab(self) -> np.ndarray:
+        frame = self.backend.grab()
+        self.recorder.write(frame)
+        return frame
+
+    def query_size(self) -> tuple:
+        return self.backend.query_size()
+
+    @property
+    def size(self) -> tuple:
+        return self.backend.size
+
+    @property
+    def scale_factor(self) -> float:
+        return self.backend.scale_factor
+
+    def close(self):
+        self.recorder.close()
+        self.backend.close()
+
+
+class ReplayCaptureSession(CaptureBackend):
+    def __init__(self, recording: Recording, realtime: bool = False, loop: bool = False):
+        """
+        回放录像的画面源，可直接交给AdvancedWindowDetector
+
+        :param recording: 录像
+        :param realtime: True时按录制时的时间轴取帧（处理慢时会跳帧），False时每次抓取前进一帧
+        :param loop: 播放完后是否从头循环，不循环时停在最后一帧并置finished
+        """
+        if not len(recording):
+            raise ValueError("录像为空")
+        self.recording = recording
+        self.realtime = realtime
+        self.loop = loop
+        self.position = 0   # 下一次抓取的帧序号
+        self.current = None # 最近一次抓取的帧序号
+        self.grabs = 0
+        self.finished = False
+        self._start = None
+        self._buffer = None
+
+    def _next_index(self) -> int:
+        total = len(self.recording)
+        if self.realtime:
+            now = time.perf_counter()
+            if self._start is None:
+                self._start = now
+            elapsed = now - self._start
+            if self.loop:
+                elapsed %= max(self.recording.duration, 1e-9)
+            index = int(np.searchsorted(self.recording.timestamps, elapsed, side='right')) - 1
+            index = max(index, 0)
+            if elapsed >= self.recording.duration and not self.loop:
+                self.finished = True
+            return min(index, total - 1)
+        index = self.position
+        if index >= total - 1:
+            if self.loop:
+                self.position = 0
+            else:
+                self.finished = True
+                self.position = total - 1
+        else:
+            self.position += 1
+        return index
+
+    def seek(self, i: int):
+        """定位到第i帧（非实时模式）"""
+        self.position = i
+        self.finished = False
+
+    def _advance(self) -> np.ndarray:
+        self.current = self._next_index()
+        self.grabs += 1
+        return self.recording.frame(self.current)
+
+    def grab(self) -> np.ndarray:
+        frame = self._advance()
+        # 模拟BitBlt：把整帧拷入复用缓冲区
+        if self._buffer is None or self._buffer.shape != frame.shape:
+            self._buffer = np.empty_like(frame)
+        np.copyto(self._buffer, frame)
+        return self._buffer
+
+    def grab_regions(self, rects: dict) -> dict:
+        # 只从内存映射中拷出各区域
+        frame = self._advance()
+        return copy_regions(frame, rects, self._region_buffers(rects))
+
+    def query_size(self) -> tuple:
+        i = self.position if self.position < len(self.recording) else len(self.recording) - 1
+        _, _, width, height = self.recording.index[i]
+        return int(width), int(height)
+
+    @property
+    def size(self) -> tuple:
+        return self.query_size()
+
+
+# 使用示例：录制MuMu窗口60秒，每0.2秒一帧
+if __name__ == "__main__":
+    import sys
+    from main import AdvancedWindowDetector
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "recordings/session"
+    detector = AdvancedWindowDetector("MuMu")
+    session = detector._ensure_capture()
+    with SessionRecorder(path) as recorder:
+        end = time.perf_counter() + 60
+        while time.perf_counter() < end:
+            recorder.write(session.grab())
+            time.sleep(0.2)
+    print(f"已录制{len(recorder)}帧到{path}")
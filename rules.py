@@ -0,0 +1,252 @@
+import ast
+import json
+import os
+import re
+
+from geometry import GeometryCache
+from preprocess import INTERPOLATIONS, OCRPreprocessor
+from scene import ProbeTable
+
+# 规则可以写入的游戏数据
+GAME_VALUES = ('life', 'max_life', 'damage', 'load')
+
+# 规则文件未给出检测间隔时的默认值（秒）：场景内 / 没有识别出场景时
+SCENE_INTERVAL = 1.0
+IDLE_INTERVAL = 3.0
+
+# 强度表达式中可用的变量和函数
+EXPRESSION_NAMES = GAME_VALUES + ('scene',)
+EXPRESSION_FUNCTIONS = {'min': min, 'max': max, 'int': int, 'abs': abs, 'round': round}
+
+# 强度表达式允许的语法（不含乘方、属性访问、下标等）
+_ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp, ast.Call, ast.Name, ast.Constant,
+    ast.Load, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.USub, ast.UAdd, ast.Not,
+    ast.And, ast.Or, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+)
+
+
+def compile_expression(expression: str):
+    """把强度表达式编译为代码对象，只允许算术、比较、条件表达式和少量内置函数"""
+    tree = ast.parse(expression, mode='eval')
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ValueError(f"强度表达式不支持: {type(node).__name__}")
+        if isinstance(node, ast.Name) and node.id not in EXPRESSION_NAMES and node.id not in EXPRESSION_FUNCTIONS:
+            raise ValueError(f"强度表达式中未知的名称: {node.id}")
+        if isinstance(node, ast.Call) and (not isinstance(node.func, ast.Name) or node.func.id not in EXPRESSION_FUNCTIONS or node.keywords):
+            raise ValueError("强度表达式只能调用 " + "/".join(EXPRESSION_FUNCTIONS))
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float, str)):
+            raise ValueError(f"强度表达式不支持常量: {node.value!r}")
+    return compile(tree, "<strength>", 'eval')
+
+
+def parse_count(text: str, rule: dict) -> dict:
+    """单个数字，例如漏怪数；包含ignore中的字符、或不是纯数字（空文本、误读成字母）时忽略"""
+    ignore = rule.get('ignore', "")
+    if ignore and any(char in text for char in ignore):
+        return {}
+    text = text.strip()
+    if not re.fullmatch(r'-?[0-9]+', text):
+        return {}
+    return {rule['value']: abs(int(text))}
+
+
+def parse_fraction(text: str, rule: dict) -> dict:
+    """"当前/上限" 形式，例如目标生命"""
+    if '/' not in text:
+        return {}
+    nums = re.findall(r'\d+', text)
+    if len(nums) < 2:
+        return {}
+    n, m = map(int, nums[:2])
+    return {rule['value']: min(n, m), rule['max_value']: max(n, m)}
+
+
+PARSERS = {'count': parse_count, 'fraction': parse_fraction}
+
+
+class ScenePlan:
+    def __init__(self, name, title, probes: list, areas: dict, ocr: list, values: dict):
+        """
+        单个场景的求值计划：该场景需要的探针、OCR区域，以及它们的几何缓存
+
+        :param probes: 探针表（场景判断探针 + 本场景用到的探针）
+        :param areas: 本场景需要识别的区域 {名称: (x起%, x止%, y起%, y止%)}
+        :param ocr: [(区域名, 条件探针或None), ...]，按顺序取第一个条件满足的区域识别
+        :param values: {数据名: ([(探针, 值), ...], 默认值)}，由探针直接决定的游戏数据
+        """
+        self.name = name
+        self.title = title
+        self.table = ProbeTable(probes)
+        self.areas = areas
+        self.ocr = ocr
+        self.values = values
+        self.geometry = GeometryCache(areas, self.table)
+
+    def classify(self, state: dict, regions: dict) -> dict:
+        """根据探针结果决定要识别的区域和探针决定的数据"""
+        frame = {'scene': self.name, 'values': {}, 'ocr': None, 'probes': state}
+        for area, condition in self.ocr:
+            if condition is None or state[condition]:
+                frame['ocr'] = (area, regions[area].copy())
+                break
+        for name, (options, default) in self.values.items():
+            frame['values'][name] = next((value for label, value in options if state[label]), default)
+        return frame
+
+
+class RulePlan:
+    def __init__(self, rules: dict, path: str = None):
+        """
+        把规则字典编译成求值计划
+
+        每个场景只包含自己需要的探针和OCR区域；场景判断探针在所有计划中都存在，
+        强度表达式预先编译，求值结果限制在 [min, max]
+        :param rules: 规则内容（格式见rules.json）
+        :param path: 规则文件路径，仅用于提示
+        """
+        self.path = path
+        self.name = rules.get('name', "")
+        probes = rules['probes']
+        for label, probe in probes.items():
+            if len(probe['at']) != 2 or len(probe['color']) != 3:
+                raise ValueError(f"探针{label}格式错误")
+
+        def probe_rows(labels):
+            return [(*probes[label]['at'], tuple(probes[label]['color']), probes[label].get('tolerance', 1), label)
+                    for label in labels]
+
+        def check_probe(label, where):
+            if label not in probes:
+                raise ValueError(f"{where}引用了未定义的探针: {label}")
+
+        # OCR区域：预处理参数和结果解析方式
+        self.areas = {}
+        self.preprocessors = {}
+        self.parsers = {}
+        self.area_values = {} # 区域名 -> 该区域写入的数据名
+        for name, area in rules['areas'].items():
+            if area.get('parse') not in PARSERS:
+                raise ValueError(f"区域{name}的parse必须是 " + "/".join(PARSERS))
+            for key in ('value', 'max_value'):
+                if key in area and area[key] not in GAME_VALUES:
+                    raise ValueError(f"区域{name}的{key}必须是 " + "/".join(GAME_VALUES))
+            self.areas[name] = tuple(area['region'])
+            self.preprocessors[name] = OCRPreprocessor(
+                area.get('scale', 3), INTERPOLATIONS[area.get('interpolation', 'cubic')], area.get('binarize', False)
+            )
+            self.parsers[name] = (PARSERS[area['parse']], area)
+            self.area_values[name] = tuple(area[key] for key in ('value', 'max_value') if key in area)
+
+        # 各场景的检测间隔（秒），idle_interval为没有识别出场景时的间隔
+        def check_interval(value, where):
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0:
+                raise ValueError(f"{where}的检测间隔必须是非负数: {value!r}")
+            return value
+
+        self.intervals = {None: check_interval(rules.get('idle_interval', IDLE_INTERVAL), "idle_interval")}
+
+        # 场景按顺序判断，第一个when探针命中的场景生效
+        self.detect = []
+        for scene in rules['scenes']:
+            check_probe(scene['when'], f"场景{scene['name']}")
+            self.detect.append((scene['name'], scene['when']))
+            self.intervals[scene['name']] = check_interval(scene.get('interval', SCENE_INTERVAL), f"场景{scene['name']}")
+        detect_labels = list(dict.fromkeys(label for _, label in self.detect))
+
+        self.scenes = {None: ScenePlan(None, None, probe_rows(detect_labels), {}, [], {})}
+        self.area_scenes = {} # 区域名 -> 使用该区域的场景
+        for scene in rules['scenes']:
+            where = f"场景{scene['name']}"
+            labels = list(detect_labels)
+            ocr = []
+            for entry in scene.get('ocr', []):
+                if entry['area'] not in self.areas:
+                    raise ValueError(f"{where}引用了未定义的区域: {entry['area']}")
+                condition = entry.get('when')
+                if condition is not None:
+                    check_probe(condition, where)
+                    labels.append(condition)
+                ocr.append((entry['area'], condition))
+                self.area_scenes.setdefault(entry['area'], scene['name'])
+            values = {}
+            for name, rule in scene.get('values', {}).items():
+                if name not in GAME_VALUES:
+                    raise ValueError(f"{where}的values只能设置 " + "/".join(GAME_VALUES))
+                for label in rule['probes']:
+                    check_probe(label, where)
+                    labels.append(label)
+                values[name] = (list(rule['probes'].items()), rule.get('default'))
+            areas = {area: self.areas[area] for area, _ in ocr}
+            self.scenes[scene['name']] = ScenePlan(
+                scene['name'], scene.get('title'), probe_rows(dict.fromkeys(labels)), areas, ocr, values
+            )
+
+        strength = rules['strength']
+        self.strength_expression = strength['expression']
+        self._strength = compile_expression(self.strength_expression)
+        self.strength_min = strength.get('min', 0)
+        self.strength_max = strength.get('max', 200)
+        self.last_strength = self.strength_min # 最近一次成功求值的结果
+        self.strength_errors = 0
+
+    def scene_of(self, state: dict):
+        """按场景顺序返回第一个命中的场景名，都不命中时为None"""
+        for name, label in self.detect:
+            if state.get(label):
+                return name
+        return None
+
+    def parse(self, area: str, results: list) -> dict:
+        """把某区域的识别结果解析为游戏数据 {数据名: 值}"""
+        parser, rule = self.parsers[area]
+        values = {}
+        for text, _ in results:
+            values.update(parser(text, rule))
+        return values
+
+    def strength(self, values: dict) -> int:
+        """计算强度并限制在 [min, max]；求值出错（例如上限读成0时除零）时沿用上一次的结果"""
+        try:
+            strength = int(eval(self._strength, {'__builtins__': {}, **EXPRESSION_FUNCTIONS}, values))
+        except (ArithmeticError, ValueError, TypeError) as e:
+            if not self.strength_errors:
+                print(f"强度公式求值出错，沿用上一次的强度{self.last_strength}: {e!r}")
+            self.strength_errors += 1
+            return self.last_strength
+        if self.strength_errors:
+            print(f"强度公式恢复正常（期间出错{self.strength_errors}次）")
+            self.strength_errors = 0
+        self.last_strength = max(self.strength_min, min(self.strength_max, strength))
+        return self.last_strength
+
+    def geometry_stats(self) -> dict:
+        return {name or 'idle': plan.geometry.stats() for name, plan in self.scenes.items()}
+
+
+def load_rules(path: str) -> RulePlan:
+    with open(path, encoding="utf-8") as f:
+        return RulePlan(json.load(f), path)
+
+
+class RuleFile:
+    def __init__(self, path: str):
+        """规则文件，修改时间变化时可重新编译"""
+        self.path = path
+        self.mtime = os.stat(path).st_mtime
+        self.plan = load_rules(path)
+        self.reloads = 0
+
+    def changed(self) -> bool:
+        try:
+            return os.stat(self.path).st_mtime != self.mtime
+        except OSError:
+            return False
+
+    def reload(self) -> RulePlan:
+        """重新编译规则，失败时抛出异常并保留原计划（文件再次修改前不再重试）"""
+        self.mtime = os.stat(self.path).st_mtime
+        self.plan = load_rules(self.path)
+        self.reloads += 1
+        return self.plan
@@ -0,0 +1,84 @@
+import numpy as np
+
+# 3x3邻域偏移
+_NEIGHBOR_DY, _NEIGHBOR_DX = (a.ravel() for a in np.mgrid[-1:2, -1:2])
+
+
+class ProbeTable:
+    def __init__(self, probes: list):
+        """
+        声明式颜色探针表，所有探针在一次NumPy取值+比较中完成判断
+
+        :param probes: [(x%, y%, BGR颜色, 容差, 标签), ...]
+                       探针命中条件：该点3x3邻域内存在每个通道都在 颜色±容差 内的像素
+                       同一位置可以有多条不同颜色的探针，只取一次像素
+        """
+        self.labels = [label for *_, label in probes]
+        if len(set(self.labels)) != len(self.labels):
+            raise ValueError("探针标签不能重复")
+        self.index = {label: i for i, label in enumerate(self.labels)}
+
+        # 去重后的采样点，以及每条探针对应的采样点下标
+        self.points = []
+        point_of_probe = []
+        for x, y, *_ in probes:
+            if (x, y) not in self.points:
+                self.points.append((x, y))
+            point_of_probe.append(self.points.index((x, y)))
+        self._point_of_probe = np.array(point_of_probe)
+        self._colors = np.array([color for _, _, color, _, _ in probes], dtype=np.int16)[:, None, :]
+        self._tolerances = np.array([tol for _, _, _, tol, _ in probes], dtype=np.int16)[:, None, None]
+
+        self._size = None
+        self._ys = self._xs = None
+
+    @property
+    def point_names(self) -> list:
+        """采样点在ROI截图中使用的区域名"""
+        return [f"probe{i}" for i in range(len(self.points))]
+
+    def resolve(self, width: int, height: int):
+        """把百分比坐标换算成像素下标（尺寸不变时直接复用）"""
+        if self._size == (width, height):
+            return
+        centers = np.array([
+            (int(round(width * x / 100)), int(round(height * y / 100))) for x, y in self.points
+        ]).reshape(-1, 2)
+        if len(centers) and (np.any(centers < 0) or np.any(centers[:, 0] >= width) or np.any(centers[:, 1] >= height)):
+            raise ValueError("中心点坐标超出图像范围")
+        # 邻域超出画面的部分夹到边界上（重复像素不影响“是否存在”的判断）
+        self._xs = np.clip(centers[:, 0:1] + _NEIGHBOR_DX, 0, width - 1)
+        self._ys = np.clip(centers[:, 1:2] + _NEIGHBOR_DY, 0, height - 1)
+        self._size = (width, height)
+
+    def region_rects(self, width: int, height: int) -> dict:
+        """各采样点3x3邻域的像素矩形 (x, y, w, h)，用于ROI截图"""
+        self.resolve(width, height)
+        rects = {}
+        for name, xs, ys in zip(self.point_names, self._xs, self._ys):
+            rects[name] = (int(xs.min()), int(ys.min()), int(xs.max() - xs.min() + 1), int(ys.max() - ys.min() + 1))
+        return rects
+
+    def _match(self, pixels: np.ndarray) -> np.ndarray:
+        """pixels: (采样点数, 9, 3) -> 每条探针是否命中"""
+        diff = np.abs(pixels[self._point_of_probe].astype(np.int16) - self._colors)
+        return (diff <= self._tolerances).all(axis=2).any(axis=1)
+
+    def evaluate(self, frame: np.ndarray) -> np.ndarray:
+        """在整帧上一次性取出所有采样点邻域并比较"""
+        height, width = frame.shape[:2]
+        self.resolve(width, height)
+        return self._match(frame[self._ys, self._xs, :3])
+
+    def evaluate_regions(self, regions: dict) -> np.ndarray:
+        """在ROI截图结果上比较（各采样点的3x3区域）"""
+        pixels = np.empty((len(self.points), 9, 3), dtype=np.uint8)
+        for i, name in enumerate(self.point_names):
+            patch = regions[name][:, :, :3].reshape(-1, 3)
+            pixels[i, :len(patch)] = patch
+            pixels[i, len(patch):] = patch[-1]  # 画面边缘不足9个像素时补齐
+        return self._match(pixels)
+
+    def state(self, hits: np.ndarray) -> dict:
+        """把命中向量转换为 {标签: 是否命中}"""
+        return dict(zip(self.labels, hits.tolist()))
@@ -0,0 +1,102 @@
+import numpy as np
+
+
+class FrameDiffGate:
+    def __init__(self, threshold: float = 3.0, max_pixels: int = 4096, max_skipped: int = 20):
+        """
+        降采样帧差门控：画面没有变化时跳过分类和OCR
+
+        :param threshold: 任一区域降采样后平均绝对差超过该值即视为变化（0~255）
+        :param max_pixels: 每张图像降采样后最多保留的像素数
+        :param max_skipped: 连续跳过该帧数后强制放行一次，防止漏判
+        """
+        self.threshold = threshold
+        self.max_pixels = max_pixels
+        self.max_skipped = max_skipped
+        self._previous = None
+        self._skipped = 0
+        self.passed = 0
+        self.gated = 0
+
+    def _signature(self, images: list) -> list:
+        signature = []
+        for image in images:
+            h, w = image.shape[:2]
+            step = max(1, int((h * w / self.max_pixels) ** 0.5))
+            # 跨步取样，astype同时完成拷贝（截图缓冲区会被下一帧覆盖）
+            signature.append(image[::step, ::step, :3].astype(np.int16))
+        return signature
+
+    def changed(self, images: list) -> bool:
+        """与上一次放行的画面比较，返回是否需要处理本帧"""
+        signature = self._signature(images)
+        previous = self._previous
+        changed = (
+            previous is None
+            or self._skipped >= self.max_skipped
+            or len(previous) != len(signature)
+            or any(
+                a.shape != b.shape or np.abs(a - b).mean() > self.threshold
+                for a, b in zip(previous, signature)
+            )
+        )
+        if changed:
+            self._previous = signature
+            self._skipped = 0
+            self.passed += 1
+        else:
+            self._skipped += 1
+            self.gated += 1
+        return changed
+
+    def reset(self):
+        self._previous = None
+        self._skipped = 0
+
+
+class AdaptiveScheduler:
+    def __init__(self, intervals: dict, min_interval: float = 0.05,
+                 max_interval: float = 5.0, backoff: float = 1.5, max_backoff: float = 4.0):
+        """
+        按场景调整检测间隔
+
+        :param intervals: {场景名: 间隔秒数}，None为没有识别出场景时的间隔，一般取自规则文件（RulePlan.intervals）
+        :param min_interval: 间隔下限
+        :param max_interval: 间隔上限
+        :param backoff: 画面连续无变化时每帧把间隔放大的倍数，有变化时恢复场景间隔
+        :param max_backoff: 放大后最多为场景间隔的倍数，保证战斗中的最坏反应时间
+        """
+        self.intervals = dict(intervals)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.scene = None
+        self.interval = self._clamp(self.intervals.get(None, max_interval))
+
+    def _clamp(self, interval: float) -> float:
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def next_interval(self, scene=None, changed: bool = True) -> float:
+        """
+        :param scene: 本帧分类结果，未分类（被门控跳过）时沿用上一次的场景
+        :param changed: 本帧画面是否有变化
+        :return: 距离下一次检测的间隔
+        """
+        if changed:
+            self.scene = scene
+            self.interval = self._clamp(self._scene_interval())
+        else:
+            limit = self._scene_interval() * self.max_backoff
+            self.interval = self._clamp(min(self.interval * self.backoff, limit))
+        return self.interval
+
+    def set_intervals(self, intervals: dict):
+        """规则重新加载后更新各场景间隔，从下一帧开始生效"""
+        self.intervals = dict(intervals)
+
+    def _scene_interval(self) -> float:
+        return self.intervals.get(self.scene, self.max_interval)
+
+    def stats(self) -> dict:
+        return {'scene': self.scene, 'interval': self.interval}
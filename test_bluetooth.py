@@ -0,0 +1,220 @@
+import asyncio
+import json
+import sys
+import types
+
+import pytest
+
+try:
+    import bleak  # noqa: F401
+except ImportError:
+    # 没有安装bleak时（例如非Windows的CI）用空模块代替，测试只使用假客户端
+    class BleakError(Exception):
+        pass
+
+    sys.modules['bleak'] = types.SimpleNamespace(BleakClient=object, BleakScanner=object)
+    sys.modules['bleak.exc'] = types.SimpleNamespace(BleakError=BleakError)
+
+from bleak.exc import BleakError
+
+import bluetooth
+
+ADDRESS = "AA:BB:CC:DD:EE:FF"
+
+
+class FakeDevice:
+    address = ADDRESS
+
+
+class FakeScanner:
+    def __init__(self):
+        self.calls = 0
+
+    async def find_device_by_name(self, name, timeout):
+        self.calls += 1
+        return FakeDevice()
+
+
+class FakeRadio:
+    def __init__(self, clamp=None):
+        """
+        假的郊狼设备：记录每个客户端写入的帧，按需回复B1
+
+        :param clamp: 设备端强度上限，B1回报限幅后的强度
+        """
+        self.clamp = clamp
+        self.up = True # 为False时连接失败（设备不在范围内）
+        self.clients = []
+
+    def client(self, target, disconnected_callback=None):
+        client = FakeClient(self, target, disconnected_callback)
+        self.clients.append(client)
+        return client
+
+
+class FakeClient:
+    def __init__(self, radio, target, disconnected_callback):
+        self.radio = radio
+        self.target = target
+        self.disconnected_callback = disconnected_callback
+        self.writes = []
+        self.handler = None
+
+    async def connect(self):
+        if not self.radio.up:
+            raise BleakError("device not found")
+
+    async def start_notify(self, uuid, handler):
+        self.handler = handler
+
+    async def write_gatt_char(self, uuid, data):
+        data = bytes(data)
+        self.writes.append(data)
+        seq = data[1] >> 4
+        if seq:
+            a, b = data[2], data[3]
+            if self.radio.clamp is not None:
+                a, b = min(a, self.radio.clamp), min(b, self.radio.clamp)
+            asyncio.get_running_loop().call_soon(self.handler, None, bytes([0xB1, seq, a, b]))
+
+    async def disconnect(self):
+        pass
+
+    def drop(self):
+        """模拟链路断开"""
+        self.disconnected_callback(self)
+
+    def strength_writes(self) -> list:
+        """带强度设定的B0帧（强度模式不为0）的 (A强度, B强度)"""
+        return [(data[2], data[3]) for data in self.writes if data[1] & 0x0F]
+
+
+def make_controller(radio, scanner=None, **kwargs):
+    return bluetooth.CoyoteBluetoothController(
+        client_factory=radio.client, scanner=scanner or FakeScanner(), **kwargs
+    )
+
+
+def test_clamped_ack_does_not_rewrite():
+    # 设备把强度限幅在50，B1回报不应让每个时隙重新写入目标强度60
+    async def run():
+        radio = FakeRadio(clamp=50)
+        controller = make_controller(radio)
+        await controller.connect()
+        controller.start_streaming()
+        for _ in range(6):
+            await controller.set_absolute_strength(60)
+            await asyncio.sleep(controller.SLOT_PERIOD)
+        await controller.disconnect()
+        return controller, radio.clients[-1]
+
+    controller, client = asyncio.run(run())
+    assert client.strength_writes() == [(60, 60)]
+    assert controller.stream_stats['strength_updates'] == 1
+    assert controller.get_device_strength() == {'A': 50, 'B': 50}
+    assert controller.B0_state['a_strength'] == 60
+
+
+def test_write_error_surfaces_on_disconnect():
+    # 写入期间断线：断线处理让序列号过期，写入方应得到原始的BLE错误而不是KeyError
+    class DroppingClient(FakeClient):
+        async def write_gatt_char(self, uuid, data):
+            self.drop()
+            await asyncio.sleep(0)
+            raise BleakError("write failed")
+
+    async def run():
+        radio = FakeRadio()
+        radio.client = lambda target, disconnected_callback=None: DroppingClient(radio, target, disconnected_callback)
+        controller = make_controller(radio, reconnect_delays=(60, 60))
+        await controller.connect()
+        try:
+            with pytest.raises(BleakError, match="write failed"):
+                await controller._send_frame(0b11, 30, 0b11, 30)
+            return controller
+        finally:
+            await controller.disconnect()
+
+    controller = asyncio.run(run())
+    assert controller._pending_commands == {}
+    assert controller.link_stats['disconnects'] == 1
+
+
+def test_reconnect_backs_off_and_replays_strength(monkeypatch):
+    delays = []
+    real_sleep = asyncio.sleep
+    radio = FakeRadio()
+
+    async def record_sleep(delay, *args):
+        # 不真正等待，只记录退避间隔；第4次等待后设备回到范围内
+        delays.append(delay)
+        radio.up = len(delays) >= 4
+        await real_sleep(0)
+
+    async def run():
+        controller = make_controller(radio, reconnect_delays=(0.5, 2.0))
+        await controller.connect()
+        await controller.set_absolute_strength(40)
+        monkeypatch.setattr(asyncio, 'sleep', record_sleep)
+        radio.clients[-1].drop()
+        await real_sleep(0)
+        await controller._reconnect_task
+        monkeypatch.undo()
+        await controller.disconnect()
+        return controller
+
+    controller = asyncio.run(run())
+    assert delays == [0.5, 1.0, 2.0, 2.0]
+    assert controller.link_stats['failed_attempts'] == 3
+    assert controller.link_stats['reconnects'] == 1
+    assert radio.clients[-1].strength_writes() == [(40, 40)]
+
+
+def test_reconnect_replays_latest_target_while_streaming():
+    # 断线期间设定的强度在重连后的第一个强度帧中发出
+    async def run():
+        radio = FakeRadio()
+        controller = make_controller(radio, reconnect_delays=(0.05, 0.05))
+        await controller.connect()
+        controller.start_streaming()
+        await controller.set_absolute_strength(30)
+        await asyncio.sleep(controller.SLOT_PERIOD * 2)
+        first = radio.clients[-1]
+        radio.up = False
+        first.drop()
+        await asyncio.sleep(0)
+        await controller.set_absolute_strength(55)
+        await asyncio.sleep(controller.SLOT_PERIOD * 2)
+        radio.up = True
+        await asyncio.sleep(controller.SLOT_PERIOD * 3)
+        await controller.disconnect()
+        return controller, first, radio.clients[-1]
+
+    controller, first, second = asyncio.run(run())
+    assert second is not first
+    assert first.strength_writes() == [(30, 30)]
+    assert second.strength_writes() == [(55, 55)]
+    assert controller.stream_stats['offline_slots'] > 0
+
+
+def test_cached_address_connects_directly(tmp_path):
+    cache = str(tmp_path / "ble_devices.json")
+
+    async def connect(radio, scanner):
+        controller = make_controller(radio, scanner, address_cache=cache)
+        await controller.connect()
+        await controller.disconnect()
+        return controller
+
+    scanner = FakeScanner()
+    first = asyncio.run(connect(FakeRadio(), scanner))
+    assert scanner.calls == 1
+    with open(cache, encoding="utf-8") as f:
+        assert json.load(f) == {first.device_name: ADDRESS}
+
+    radio = FakeRadio()
+    second = asyncio.run(connect(radio, scanner))
+    assert scanner.calls == 1
+    assert radio.clients[0].target == ADDRESS
+    assert second.link_stats['direct_connects'] == 1
+    assert second.link_stats['scans'] == 0
@@ -0,0 +1,88 @@
+import json
+import numpy as np
+from coyote_protocol import FREQUENCY_LUT
+
+STEPS_PER_SLOT = 4 # 每个100ms时隙包含4个25ms波形步
+
+_FREQUENCY_TABLE = np.frombuffer(FREQUENCY_LUT, dtype=np.uint8)
+_SLOT_OFFSETS = np.arange(STEPS_PER_SLOT)
+
+
+class Waveform:
+    def __init__(self, frequencies, intensities, name: str = ""):
+        """
+        波形：由任意数量的25ms步组成，每步为 (频率, 强度)
+
+        :param frequencies: 输入频率序列（10~1000）
+        :param intensities: 波形强度序列（0~100）
+        :param name: 波形名称
+        """
+        if len(frequencies) != len(intensities) or not len(frequencies):
+            raise ValueError("频率和强度序列长度必须一致且不为空")
+        self.name = name
+        self.steps = np.column_stack((
+            np.clip(frequencies, 0, 1000),
+            np.clip(intensities, 0, 100),
+        )).astype(np.uint16)
+        # 预先转换为协议值，发送时只做取下标
+        self.encoded_frequencies = _FREQUENCY_TABLE[self.steps[:, 0]]
+        self.encoded_intensities = self.steps[:, 1].astype(np.uint8)
+
+    def __len__(self):
+        return len(self.steps)
+
+    @classmethod
+    def from_steps(cls, steps, name: str = ""):
+        """由 [(频率, 强度), ...] 创建"""
+        steps = np.asarray(steps)
+        return cls(steps[:, 0], steps[:, 1], name)
+
+
+class WaveformGenerator:
+    def __init__(self, waveform: Waveform):
+        """单个通道的波形发生器，按需生成下一个时隙的8字节波形数据，循环播放"""
+        self.waveform = waveform
+        self.position = 0
+
+    def set(self, waveform: Waveform, restart: bool = True):
+        """切换波形（只替换引用）"""
+        self.waveform = waveform
+        if restart:
+            self.position = 0
+
+    def next_slot(self) -> bytes:
+        """取出下一个100ms时隙的4个频率 + 4个强度"""
+        waveform = self.waveform
+        index = (self.position + _SLOT_OFFSETS) % len(waveform)
+        self.position = (self.position + STEPS_PER_SLOT) % len(waveform)
+        return waveform.encoded_frequencies[index].tobytes() + waveform.encoded_intensities[index].tobytes()
+
+
+class WaveformLibrary:
+    def __init__(self, path: str = None):
+        """
+        具名波形库
+
+        :param path: 可选的JSON波形文件，格式为 {"名称": [[频率, 强度], ...]}
+        """
+        self._waveforms = {}
+        self.add(Waveform([10] * 4, [5] * 4, "default"))
+        if path:
+            self.load(path)
+
+    def add(self, waveform: Waveform):
+        self._waveforms[waveform.name] = waveform
+
+    def load(self, path: str):
+        with open(path, encoding="utf-8") as f:
+            for name, steps in json.load(f).items():
+                self.add(Waveform.from_steps(steps, name))
+
+    def get(self, name: str) -> Waveform:
+        try:
+            return self._waveforms[name]
+        except KeyError:
+            raise ValueError(f"未知波形: {name}")
+
+    def names(self) -> list:
+        return list(self._waveforms)